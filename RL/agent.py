@@ -104,3 +104,226 @@ class QLearningAgent:
     def get_solution_path(self) -> List[Tuple[str, str]]:
         """Get the sequence of states and actions that led to the solution."""
         return self.action_history
+
+
+class ArrayQLearningAgent(QLearningAgent):
+    """
+    Q-learning agent with states and actions interned to integer ids.
+
+    Q-values live in a 2-D NumPy array (state id x action id) that grows by
+    doubling, next to a mask of the actions seen valid in every state, so
+    greedy selection and the max-next-Q lookup are array operations. It is
+    a drop-in replacement for QLearningAgent; the ``*_batch`` methods act
+    on arrays of state and action ids for vectorised environments.
+    """
+
+    def __init__(
+        self,
+        learning_rate: float = 0.1,
+        discount_factor: float = 0.9,
+        exploration_rate: float = 0.1,
+        initial_states: int = 1024,
+        initial_actions: int = 8,
+        seed: int = None,
+    ):
+        """
+        Initialize the agent.
+
+        Args:
+            learning_rate: Alpha - learning rate
+            discount_factor: Gamma - discount factor for future rewards
+            exploration_rate: Epsilon - probability of taking a random action
+            initial_states: Initial number of rows of the Q-table
+            initial_actions: Initial number of columns of the Q-table
+            seed: Seed of the generator used by the batch methods
+        """
+        super().__init__(learning_rate, discount_factor, exploration_rate)
+        self.state_ids: Dict[MathExpressionState, int] = {}
+        self.action_ids: Dict[str, int] = {}
+        self.actions: List[str] = []
+        self.q_values = np.zeros((initial_states, initial_actions))
+        self.valid_mask = np.zeros((initial_states, initial_actions), dtype=bool)
+        self.rng = np.random.default_rng(seed)
+
+    def _grow(self, n_states: int, n_actions: int) -> None:
+        """Double the table dimensions until they hold the given sizes."""
+        rows, cols = self.q_values.shape
+        if n_states <= rows and n_actions <= cols:
+            return
+        while rows < n_states:
+            rows *= 2
+        while cols < n_actions:
+            cols *= 2
+        q_values = np.zeros((rows, cols))
+        valid_mask = np.zeros((rows, cols), dtype=bool)
+        old_rows, old_cols = self.q_values.shape
+        q_values[:old_rows, :old_cols] = self.q_values
+        valid_mask[:old_rows, :old_cols] = self.valid_mask
+        self.q_values, self.valid_mask = q_values, valid_mask
+
+    def state_id(self, state) -> int:
+        """Integer id of ``state``, interned by the state's own hash and equality."""
+        state_id = self.state_ids.get(state)
+        if state_id is None:
+            state_id = self.state_ids[state] = len(self.state_ids)
+            self._grow(state_id + 1, len(self.actions))
+        return state_id
+
+    def action_id(self, action: str) -> int:
+        """Integer id of ``action``."""
+        action_id = self.action_ids.get(action)
+        if action_id is None:
+            action_id = self.action_ids[action] = len(self.actions)
+            self.actions.append(action)
+            self._grow(len(self.state_ids), action_id + 1)
+        return action_id
+
+    def _valid_ids(self, state_id: int, valid_actions: List[str]) -> List[int]:
+        """Action ids of ``valid_actions``, recorded in the valid-action mask."""
+        ids = [self.action_id(action) for action in valid_actions]
+        self.valid_mask[state_id, ids] = True
+        return ids
+
+    def get_action(self, state: MathExpressionState, valid_actions: List[str]) -> str:
+        if not valid_actions:
+            return "finish"
+
+        if random.random() < self.epsilon:
+            return random.choice(valid_actions)
+
+        state_id = self.state_id(state)
+        ids = self._valid_ids(state_id, valid_actions)
+        row = self.q_values[state_id].tolist()
+        q_values = [row[i] for i in ids]
+        max_q = max(q_values)
+        best_actions = [
+            action
+            for action, q_val in zip(valid_actions, q_values)
+            if abs(q_val - max_q) < 1e-9
+        ]
+        return random.choice(best_actions)
+
+    def update(
+        self,
+        state: MathExpressionState,
+        action: str,
+        reward: float,
+        next_state: MathExpressionState,
+        next_valid_actions: List[str],
+    ) -> None:
+        state_id = self.state_id(state)
+        action_id = self.action_id(action)
+        next_state_id = self.state_id(next_state)
+        if next_valid_actions:
+            ids = self._valid_ids(next_state_id, next_valid_actions)
+            row = self.q_values[next_state_id].tolist()
+            max_next_q = max(row[i] for i in ids)
+        else:
+            max_next_q = 0
+
+        q_values = self.q_values
+        current_q = float(q_values[state_id, action_id])
+        q_values[state_id, action_id] = current_q + self.lr * (
+            reward + self.gamma * max_next_q - current_q
+        )
+        self.valid_mask[state_id, action_id] = True
+
+        # States build their strings lazily, so keep the state itself
+        self.action_history.append((state, action, reward))
+
+    def state_ids_batch(self, states) -> np.ndarray:
+        """Integer ids of a batch of states."""
+        return np.fromiter(
+            (self.state_id(state) for state in states), dtype=np.int64, count=len(states)
+        )
+
+    def record_valid_batch(
+        self, state_ids: np.ndarray, valid: np.ndarray, actions: List[str]
+    ) -> np.ndarray:
+        """
+        Record the valid actions of a batch of states, e.g. the mask returned
+        by VectorEnv.get_valid_actions.
+
+        Args:
+            state_ids: State ids
+            valid: Boolean mask of shape (len(state_ids), len(actions))
+            actions: Action of every column of ``valid``
+
+        Returns:
+            ``valid`` with one column per action id, as taken by
+            get_actions_batch and update_batch
+        """
+        action_ids = [self.action_id(action) for action in actions]
+        mask = np.zeros((len(state_ids), self.q_values.shape[1]), dtype=bool)
+        mask[:, action_ids] = valid
+        self.valid_mask[state_ids] |= mask
+        return mask
+
+    def get_actions_batch(
+        self, state_ids: np.ndarray, valid_mask: np.ndarray = None
+    ) -> np.ndarray:
+        """
+        Epsilon-greedy action ids for a batch of states; ties are broken at
+        random.
+
+        Args:
+            state_ids: State ids, every state with at least one valid action
+            valid_mask: Valid action ids of every state, as returned by
+                record_valid_batch; defaults to the recorded masks
+
+        Returns:
+            One action id per state
+        """
+        mask = self.valid_mask[state_ids] if valid_mask is None else valid_mask
+        q_values = np.where(mask, self.q_values[state_ids], -np.inf)
+        best = mask & (q_values >= q_values.max(axis=1, keepdims=True) - 1e-9)
+        # Random tie-breaking: the largest random key among the best actions
+        greedy = np.argmax(best * self.rng.random(best.shape), axis=1)
+        random_valid = np.argmax(mask * self.rng.random(mask.shape), axis=1)
+        explore = self.rng.random(len(state_ids)) < self.epsilon
+        return np.where(explore, random_valid, greedy)
+
+    def update_batch(
+        self,
+        state_ids: np.ndarray,
+        action_ids: np.ndarray,
+        rewards: np.ndarray,
+        next_state_ids: np.ndarray,
+        done: np.ndarray,
+        next_valid_mask: np.ndarray = None,
+    ) -> None:
+        """
+        Apply the Q-learning update to a batch of transitions. Terminal
+        transitions and next states without valid actions use a max-next-Q
+        of 0. Repeated (state, action) pairs in a batch are updated once.
+
+        Args:
+            state_ids: State ids
+            action_ids: Action id taken in every state
+            rewards: Reward of every transition
+            next_state_ids: Next state ids
+            done: Whether every transition ends its episode
+            next_valid_mask: Valid action ids of the next states, as returned
+                by record_valid_batch; defaults to the recorded masks
+        """
+        if next_valid_mask is None:
+            next_valid_mask = self.valid_mask[next_state_ids]
+        next_q = np.where(
+            next_valid_mask, self.q_values[next_state_ids], -np.inf
+        ).max(axis=1)
+        next_q = np.where(done | ~next_valid_mask.any(axis=1), 0.0, next_q)
+        current_q = self.q_values[state_ids, action_ids]
+        self.q_values[state_ids, action_ids] = current_q + self.lr * (
+            rewards + self.gamma * next_q - current_q
+        )
+        self.valid_mask[state_ids, action_ids] = True
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        """Q-values of the valid actions of every state, keyed by strings."""
+        return {
+            str(state): {
+                self.actions[action_id]: float(self.q_values[state_id, action_id])
+                for action_id in np.flatnonzero(self.valid_mask[state_id])
+            }
+            for state, state_id in self.state_ids.items()
+        }
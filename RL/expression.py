@@ -0,0 +1,260 @@
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Node kinds
+NUM, ADD, GROUP = "num", "add", "group"
+
+_TOKEN_PATTERN = re.compile(r"\s*(?:(\d+)|(.))")
+
+
+class Expression:
+    """
+    Immutable node of an addition expression tree.
+
+    ``add`` nodes print as ``left + right`` without parentheses; only
+    ``group`` nodes print parentheses, so "(8 + 2) + 1 + 1" is
+    add(group(add(8, 2)), add(1, 1)). Nodes are hash-consed: building a node
+    equal to an existing one returns the existing object, so equality and
+    hashing are by identity and cost O(1) whatever the size of the tree. The
+    canonical string is built on first use and cached.
+
+    Build nodes with num, add, group or parse_expression, not directly.
+    """
+
+    __slots__ = ("kind", "value", "left", "right", "has_group", "_string", "_total")
+
+    def __init__(self, kind: str, value: int, left, right):
+        self.kind = kind
+        self.value = value
+        self.left = left
+        self.right = right
+        self.has_group = kind == GROUP or any(
+            child is not None and child.has_group for child in (left, right)
+        )
+        self._string = None
+        self._total = value
+
+    def __str__(self):
+        if self._string is None:
+            # Post-order without recursion, so long sums do not hit the limit
+            stack = [self]
+            while stack:
+                node = stack[-1]
+                pending = [
+                    child
+                    for child in (node.left, node.right)
+                    if child is not None and child._string is None
+                ]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                stack.pop()
+                if node.kind == NUM:
+                    node._string = str(node.value)
+                elif node.kind == GROUP:
+                    node._string = f"({node.left._string})"
+                else:
+                    node._string = f"{node.left._string} + {node.right._string}"
+        return self._string
+
+    def __repr__(self):
+        return f"Expression({str(self)!r})"
+
+
+# Every node built so far by (kind, value, id(left), id(right)). Nodes keep
+# their children alive, so the ids stay valid; nodes are kept for the life
+# of the process, like the states in a Q-table; see clear_nodes
+_nodes: Dict[tuple, "Expression"] = {}
+# Number leaves by value, looked up without building a key
+_numbers: Dict[int, "Expression"] = {}
+
+
+def _node(
+    kind: str, value: int = None, left: Expression = None, right: Expression = None
+) -> Expression:
+    key = (kind, value, id(left), id(right))
+    node = _nodes.get(key)
+    if node is None:
+        node = _nodes[key] = Expression(kind, value, left, right)
+    return node
+
+
+def clear_nodes() -> None:
+    """
+    Forget the built nodes, e.g. between unrelated training runs. Nodes that
+    are still referenced stay valid but are no longer shared with new ones,
+    so states built before and after must not be compared.
+    """
+    _nodes.clear()
+    _numbers.clear()
+
+
+def num(value: int) -> Expression:
+    """Number leaf."""
+    node = _numbers.get(value)
+    if node is None:
+        value = int(value)
+        node = _numbers[value] = _node(NUM, value=value)
+    return node
+
+
+def add(left: Expression, right: Expression) -> Expression:
+    """
+    Sum ``left + right``, printed without parentheses. Sums are kept nested
+    to the right, so expressions with the same string are the same node.
+    """
+    if left.kind == ADD:
+        return add(left.left, add(left.right, right))
+    return _node(ADD, left=left, right=right)
+
+
+def group(child: Expression) -> Expression:
+    """Parenthesized ``(child)``."""
+    return _node(GROUP, left=child)
+
+
+def add_terms(terms: List[Expression]) -> Expression:
+    """Flat sum of ``terms``, nested to the right."""
+    expression = terms[-1]
+    for term in reversed(terms[:-1]):
+        expression = add(term, expression)
+    return expression
+
+
+def terms(expression: Expression) -> Iterator[Expression]:
+    """Top-level terms of a flat sum, from left to right."""
+    while expression.kind == ADD:
+        yield expression.left
+        expression = expression.right
+    yield expression
+
+
+def parse_expression(text: str) -> Expression:
+    """
+    Parse sums of non-negative integers with parentheses, e.g.
+    "(8 + 2) + 1 + 1"; whitespace is not significant.
+
+    Raises:
+        ValueError: If ``text`` is not such a sum
+    """
+    tokens = []
+    for number, symbol in _TOKEN_PATTERN.findall(text.strip()):
+        if number:
+            tokens.append(num(number))
+        elif symbol.strip():
+            tokens.append(symbol)
+    position = 0
+
+    def parse_sum() -> Expression:
+        nonlocal position
+        summands = [parse_term()]
+        while position < len(tokens) and tokens[position] == "+":
+            position += 1
+            summands.append(parse_term())
+        return add_terms(summands)
+
+    def parse_term() -> Expression:
+        nonlocal position
+        if position >= len(tokens):
+            raise ValueError(f"Unexpected end of expression: {text!r}")
+        token = tokens[position]
+        position += 1
+        if isinstance(token, Expression):
+            return token
+        if token == "(":
+            inner = parse_sum()
+            if position >= len(tokens) or tokens[position] != ")":
+                raise ValueError(f"Unbalanced parentheses in {text!r}")
+            position += 1
+            return group(inner)
+        raise ValueError(f"Unexpected {token!r} in {text!r}")
+
+    expression = parse_sum()
+    if position != len(tokens):
+        raise ValueError(f"Unexpected {tokens[position]!r} in {text!r}")
+    return expression
+
+
+def evaluate(expression: Expression) -> int:
+    """
+    Value of ``expression``. Only numbers, sums and parentheses exist in the
+    tree, so nothing is executed, unlike ``eval`` on its string. Values are
+    cached on the nodes, so shared subexpressions are summed once and a
+    rewritten tree only sums the nodes on the rewritten path.
+    """
+    if expression._total is None:
+        # Post-order without recursion, as in __str__
+        stack = [expression]
+        while stack:
+            node = stack[-1]
+            pending = [
+                child
+                for child in (node.left, node.right)
+                if child is not None and child._total is None
+            ]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            if node.kind == GROUP:
+                node._total = node.left._total
+            else:
+                node._total = node.left._total + node.right._total
+    return expression._total
+
+
+def find_last_group(expression: Expression) -> Optional[List[Expression]]:
+    """
+    Path from ``expression`` to the group whose "(" comes last in its
+    string, i.e. the innermost parenthesized expression, or None. Subtrees
+    without groups are skipped, so the cost is the depth of the group.
+    """
+    path = [expression]
+    node = expression
+    while True:
+        for child in (node.right, node.left):
+            if child is not None and child.has_group:
+                path.append(child)
+                node = child
+                break
+        else:
+            return path if node.kind == GROUP else None
+
+
+def replace_path(path: List[Expression], replacement: Expression) -> Expression:
+    """Rebuild the ancestors on ``path`` with its last node replaced."""
+    node = replacement
+    for parent, child in zip(reversed(path[:-1]), reversed(path[1:])):
+        if parent.kind == GROUP:
+            node = group(node)
+        elif parent.left is child:
+            node = add(node, parent.right)
+        else:
+            node = add(parent.left, node)
+    return node
+
+
+def replace_all(expression: Expression, old: Expression, new: Expression) -> Expression:
+    """Replace every occurrence of the group ``old`` by ``new``."""
+    if expression is old:
+        return new
+    if not expression.has_group:
+        return expression
+    if expression.kind == GROUP:
+        return group(replace_all(expression.left, old, new))
+    return add(
+        replace_all(expression.left, old, new), replace_all(expression.right, old, new)
+    )
+
+
+def leading_operands(expression: Expression) -> Optional[Tuple[int, int]]:
+    """First two numbers of ``expression``, ignoring parentheses, or None."""
+    values = []
+    stack = [expression]
+    while stack and len(values) < 2:
+        node = stack.pop()
+        if node.kind == NUM:
+            values.append(node.value)
+        else:
+            stack.extend(child for child in (node.right, node.left) if child is not None)
+    return tuple(values) if len(values) == 2 else None
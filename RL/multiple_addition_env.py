@@ -1,46 +1,79 @@
 import numpy as np
-from typing import List, Tuple, Dict, Any, Optional
+from typing import List, Tuple, Dict, Any, Union
+
+from expression import (
+    ADD,
+    Expression,
+    add,
+    add_terms,
+    evaluate,
+    find_last_group,
+    group,
+    num,
+    parse_expression,
+    replace_path,
+    terms,
+)
 
 
 class MultipleAdditionState:
     """Represents a state in the multiple addition chain."""
 
-    def __init__(self, expression: str, step_num: int = 0):
-        self.expression = expression
+    def __init__(self, expression: Union[str, Expression], step_num: int = 0):
+        """
+        Args:
+            expression: Expression tree, or its string form (e.g. "(2 + 3) + 4")
+            step_num: Number of steps taken to reach this state
+        """
+        if isinstance(expression, str):
+            expression = parse_expression(expression)
+        self.tree = expression
         self.step_num = step_num
 
+    @property
+    def expression(self) -> str:
+        """Canonical string of the expression, cached by the tree."""
+        return str(self.tree)
+
     def __str__(self):
-        return self.expression
+        return str(self.tree)
 
     def __eq__(self, other):
         if not isinstance(other, MultipleAdditionState):
             return False
-        return self.expression == other.expression
+        # Trees are hash-consed, so equal trees are the same object
+        return self.tree is other.tree
 
     def __hash__(self):
-        return hash(self.expression)
+        return hash(self.tree)
 
 
 class MultipleAdditionEnv:
     """Environment for multiple addition problems."""
 
-    def __init__(self, initial_expression: str, target_result: int):
+    # Every action the environment can report as valid
+    ACTIONS = ["group_left", "group_right", "calculate", "finish"]
+
+    def __init__(self, initial_expression: str, target_result: int, max_steps: int = 20):
         """
         Initialize the environment with an initial expression and target result.
 
         Args:
             initial_expression: The starting mathematical expression (e.g., "2 + 3 + 4")
             target_result: The expected final result (e.g., 9)
+            max_steps: Maximum number of steps per episode; summing n
+                numbers takes 2n - 1 steps
         """
         self.initial_state = MultipleAdditionState(initial_expression)
         self.current_state = self.initial_state
         self.target_result = target_result
+        self.target = num(target_result)
         self.done = False
-        self.max_steps = 20  # Increased for multiple additions
+        self.max_steps = max_steps  # Increased for multiple additions
         self.step_count = 0
 
         # Parse the initial expression
-        self.numbers = [int(n.strip()) for n in initial_expression.split("+")]
+        self.numbers = [term.value for term in terms(self.initial_state.tree)]
         self.n = len(self.numbers)
 
     def reset(self) -> MultipleAdditionState:
@@ -52,30 +85,19 @@ class MultipleAdditionEnv:
 
     def get_valid_actions(self) -> List[str]:
         """Get list of valid actions from current state."""
-        expression = self.current_state.expression
+        tree = self.current_state.tree
 
-        # If we have a simple expression without parentheses
-        if "(" not in expression:
-            if "+" in expression:
-                return ["group_left", "group_right"]
-            else:
-                try:
-                    value = int(expression.strip())
-                    if value == self.target_result:
-                        return ["finish"]
-                    else:
-                        return []
-                except ValueError:
-                    return []
-
-        # If we have a grouped expression
-        if "(" in expression:
-            # If we have a simple addition inside parentheses
-            if expression.count("+") == 1:
-                return ["calculate"]
-            else:
-                return ["group_left", "group_right"]
+        # If we have a grouped addition, calculate it first
+        if tree.has_group:
+            return ["calculate"]
 
+        # If we have a sum of several numbers
+        if tree.kind == ADD:
+            return ["group_left", "group_right"]
+
+        # If we're at a final number
+        if tree is self.target:
+            return ["finish"]
         return []
 
     def step(
@@ -84,6 +106,10 @@ class MultipleAdditionEnv:
         """
         Take a step in the environment by applying the chosen action.
 
+        Actions rewrite the expression tree: grouping rebuilds the spine of
+        the sum up to the grouped terms and calculating rebuilds the path to
+        the innermost group.
+
         Args:
             action: The action to take
 
@@ -96,75 +122,63 @@ class MultipleAdditionEnv:
         self.step_count += 1
         reward = 0
         info = {}
+        tree = self.current_state.tree
+        new_tree = tree
 
         if action == "group_left":
             # Group from left to right
             # Example: "2 + 3 + 4" to "(2 + 3) + 4"
-            parts = self.current_state.expression.split("+")
-            if len(parts) >= 2:
-                left = parts[0].strip()
-                right = parts[1].strip()
-                new_expression = f"({left} + {right})"
-                if len(parts) > 2:
-                    new_expression += " + " + " + ".join(parts[2:])
+            if tree.kind == ADD:
+                right = tree.right
+                if right.kind == ADD:
+                    new_tree = add(group(add(tree.left, right.left)), right.right)
+                else:
+                    new_tree = group(tree)
                 reward = 1.0
             else:
-                new_expression = self.current_state.expression
                 reward = -1.0
 
         elif action == "group_right":
             # Group from right to left
             # Example: "2 + 3 + 4" to "2 + (3 + 4)"
-            parts = self.current_state.expression.split("+")
-            if len(parts) >= 2:
-                left = " + ".join(parts[:-1])
-                right = parts[-1].strip()
-                new_expression = f"{left} + ({right})"
+            if tree.kind == ADD:
+                spine = [tree]
+                while spine[-1].right.kind == ADD:
+                    spine.append(spine[-1].right)
+                new_tree = add_terms(
+                    [node.left for node in spine[:-1]] + [group(spine[-1])]
+                )
                 reward = 1.0
             else:
-                new_expression = self.current_state.expression
                 reward = -1.0
 
         elif action == "calculate":
-            # Calculate the result of a simple addition
-            try:
-                # Remove parentheses and evaluate
-                expr = self.current_state.expression.replace("(", "").replace(")", "")
-                result = eval(expr)
-                new_expression = str(result)
+            # Calculate the result of the innermost grouped addition
+            path = find_last_group(tree)
+            if path:
+                new_tree = replace_path(path, num(evaluate(path[-1])))
                 reward = 1.0
-            except:
-                new_expression = self.current_state.expression
+            else:
                 reward = -1.0
 
         elif action == "finish":
             # Finish the calculation
-            new_expression = self.current_state.expression
-            try:
-                result = int(new_expression.strip())
-                if result == self.target_result:
-                    reward = 5.0
-                    self.done = True
-                else:
-                    reward = -5.0
-            except:
+            if tree is self.target:
+                reward = 5.0
+                self.done = True
+            else:
                 reward = -5.0
 
         else:
-            new_expression = self.current_state.expression
             reward = -1.0
 
         # Update current state
-        self.current_state = MultipleAdditionState(new_expression, self.step_count)
+        self.current_state = MultipleAdditionState(new_tree, self.step_count)
 
         # Check if we've reached the maximum number of steps
         if self.step_count >= self.max_steps:
             self.done = True
-            try:
-                result = int(new_expression.strip())
-                if result != self.target_result:
-                    reward -= 3.0
-            except:
+            if new_tree is not self.target:
                 reward -= 3.0
 
         return self.current_state, reward, self.done, info
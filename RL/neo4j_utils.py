@@ -1,29 +1,112 @@
-from neo4j import GraphDatabase
+import os
+import sys
 from typing import Dict, Any, Tuple, List, Optional
 
+# Add the project root to the path so the shared driver registry can be imported
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.neo4j_drivers import get_driver, provision_once
+
+# Entity properties that get a range index, so that the label-qualified
+# id/problem lookups below do not scan every node
+INDEXED_PROPERTIES = ("id", "graph", "step", "problem")
+
+# Default number of nodes removed per transaction by clean_database
+DEFAULT_DELETE_BATCH_SIZE = 10000
+
 
 class Neo4JUtils:
     """Utility class for interacting with Neo4j database."""
 
-    def __init__(self, uri: str, auth: Tuple[str, str]):
+    def __init__(
+        self,
+        uri: str,
+        auth: Tuple[str, str],
+        ensure_indexes: bool = True,
+        **driver_config,
+    ):
         """
         Initialize the Neo4j connection.
 
         Args:
             uri: Neo4j connection URI (e.g., "bolt://localhost:7687")
             auth: Tuple of (username, password)
+            ensure_indexes: Whether to create the Entity indexes on startup;
+                they are created once per shared driver
+            **driver_config: Pool settings passed to the shared driver registry
+                (max_connection_pool_size, connection_acquisition_timeout,
+                liveness_check_timeout)
         """
-        self.driver = GraphDatabase.driver(uri, auth=auth)
+        self.driver = get_driver(uri, auth, **driver_config)
         self.current_step = 0
+        if ensure_indexes:
+            # Once per shared driver, not once per instance
+            provision_once(self.driver, "entity_indexes", self.ensure_indexes)
 
     def close(self):
-        """Close the Neo4j connection."""
-        self.driver.close()
+        """
+        Release this instance. The driver is shared per URI/auth across the
+        process and is closed by close_all_drivers() at interpreter exit.
+        """
+        self.driver = None
+
+    def ensure_indexes(self) -> None:
+        """Create the range indexes on Entity lookup properties if missing."""
+        with self.driver.session() as session:
+            for prop in INDEXED_PROPERTIES:
+                session.run(
+                    f"CREATE INDEX entity_{prop} IF NOT EXISTS "
+                    f"FOR (n:Entity) ON (n.{prop})"
+                )
+
+    def clean_database(
+        self,
+        problem: Optional[str] = None,
+        graph: Optional[str] = None,
+        batch_size: int = DEFAULT_DELETE_BATCH_SIZE,
+        verbose: bool = False,
+    ) -> int:
+        """
+        Delete nodes and relationships in batches of at most batch_size nodes.
+
+        Args:
+            problem: Only delete entities stored for this problem
+            graph: Only delete entities stored for this graph name
+            batch_size: Maximum number of nodes deleted per transaction
+            verbose: Whether to print progress after each batch
+
+        Returns:
+            Number of deleted nodes
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+
+        conditions = []
+        params: Dict[str, Any] = {"batch_size": batch_size}
+        if problem is not None:
+            conditions.append("n.problem = $problem")
+            params["problem"] = problem
+        if graph is not None:
+            conditions.append("n.graph = $graph")
+            params["graph"] = graph
+
+        if conditions:
+            query = "MATCH (n:Entity) WHERE " + " AND ".join(conditions)
+        else:
+            query = "MATCH (n)"
+        query += " WITH n LIMIT $batch_size DETACH DELETE n RETURN count(*) AS deleted"
 
-    def clean_database(self):
-        """Delete all nodes and relationships in the database."""
+        total_deleted = 0
         with self.driver.session() as session:
-            session.run("MATCH (n) DETACH DELETE n")
+            while True:
+                deleted = session.execute_write(
+                    lambda tx: tx.run(query, params).single()["deleted"]
+                )
+                total_deleted += deleted
+                if verbose:
+                    print(f"Deleted {total_deleted} nodes")
+                if deleted < batch_size:
+                    return total_deleted
 
     def create_node(self, entity: Dict[str, Any]) -> str:
         """
@@ -73,27 +156,50 @@ class Neo4JUtils:
         Create a relationship between two nodes.
 
         Args:
-            relation: Relation dictionary with source, target, and type
+            relation: Relation dictionary with source, target, and type. When
+                it has a ``graph`` key, only nodes of that graph are matched,
+                since ids are only unique within one graph
         """
         properties = {
             k: v for k, v in relation.items() if k not in ["source", "target", "type"]
         }
         properties["step"] = self.current_step
+        scope = self._scope(graph=relation.get("graph"))
 
         with self.driver.session() as session:
             session.run(
-                """
-                MATCH (source:Entity {id: $source}), (target:Entity {id: $target})
-                CREATE (source)-[r:RELATION {type: $type, properties: $properties}]->(target)
+                f"""
+                MATCH (source:Entity {{id: $source{scope}}}), (target:Entity {{id: $target{scope}}})
+                CREATE (source)-[r:RELATION {{type: $type, properties: $properties}}]->(target)
                 """,
                 source=relation["source"],
                 target=relation["target"],
                 type=relation["type"],
                 properties=properties,
+                graph=relation.get("graph"),
             )
 
+    @staticmethod
+    def _scope(problem: Optional[str] = None, graph: Optional[str] = None) -> str:
+        """
+        Extra property filters restricting an id lookup to one problem and/or
+        graph, to append inside a node pattern's property map.
+        """
+        scope = ""
+        if problem is not None:
+            scope += ", problem: $problem"
+        if graph is not None:
+            scope += ", graph: $graph"
+        return scope
+
     def create_relation_with_ids(
-        self, source_id: str, target_id: str, rel_type: str, properties: Dict[str, Any]
+        self,
+        source_id: str,
+        target_id: str,
+        rel_type: str,
+        properties: Dict[str, Any],
+        problem: Optional[str] = None,
+        graph: Optional[str] = None,
     ) -> None:
         """
         Create a relationship between two nodes using their IDs.
@@ -103,18 +209,24 @@ class Neo4JUtils:
             target_id: Target node ID
             rel_type: Relationship type
             properties: Relationship properties
+            problem: Only match nodes stored for this problem; ids such as
+                "0", "1", ... repeat across problems
+            graph: Only match nodes stored for this graph name
         """
         properties["step"] = self.current_step
+        scope = self._scope(problem, graph)
 
         with self.driver.session() as session:
             session.run(
                 f"""
-                MATCH (source:Entity {{id: $source_id}}), (target:Entity {{id: $target_id}})
+                MATCH (source:Entity {{id: $source_id{scope}}}), (target:Entity {{id: $target_id{scope}}})
                 CREATE (source)-[r:{rel_type} $properties]->(target)
                 """,
                 source_id=source_id,
                 target_id=target_id,
                 properties=properties,
+                problem=problem,
+                graph=graph,
             )
 
     def increment_step(self) -> None:
@@ -131,14 +243,14 @@ class Neo4JUtils:
             triplets: Dictionary with 'entities' and 'relations' lists
             graph_name: Name to identify this graph
         """
-        # Clean the database first
-        self.clean_database()
+        # Remove any previous version of this graph
+        self.clean_database(graph=graph_name)
 
-        # Create entities
+        # Create entities, keeping their ids so the relations can match them
         for entity in triplets.get("entities", []):
-            entity_copy = entity.copy()
-            entity_copy["graph"] = graph_name
-            self.create_node(entity_copy)
+            properties = {k: v for k, v in entity.items() if k != "id"}
+            properties["graph"] = graph_name
+            self.create_node_with_id(entity["id"], properties)
 
         # Create relations
         for relation in triplets.get("relations", []):
@@ -0,0 +1,151 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Literal, Optional, Sequence, Tuple
+import random
+import numpy as np
+
+from .agent import ArrayQLearningAgent, QLearningAgent
+from .environment import AdditionRecursionEnv
+from .graph_builder import KnowledgeGraphBuilder
+from .multiple_addition_env import MultipleAdditionEnv
+from .trainer import RLTrainer
+
+ENVIRONMENTS = {
+    "addition": AdditionRecursionEnv,
+    "multiple_addition": MultipleAdditionEnv,
+}
+
+
+def _train_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Train a fresh agent on one problem with one seed, in a worker process.
+
+    Everything returned is plain data: states are replaced by their strings,
+    since expression trees are only shared within a process.
+    """
+    random.seed(task["seed"])
+    np.random.seed(task["seed"])
+    env_kwargs = {}
+    if task["max_steps"] is not None:
+        env_kwargs["max_steps"] = task["max_steps"]
+    env = ENVIRONMENTS[task["env"]](
+        task["expression"], task["target_result"], **env_kwargs
+    )
+    agent = ArrayQLearningAgent(seed=task["seed"], **task["agent_kwargs"])
+    trainer = RLTrainer(env, agent, KnowledgeGraphBuilder(), task["num_episodes"])
+    stats = trainer.train(progress_bar=False)
+    return {
+        "expression": task["expression"],
+        "target_result": task["target_result"],
+        "seed": task["seed"],
+        "episode_rewards": stats["episode_rewards"],
+        "best_reward": stats["best_reward"],
+        "best_solution": [
+            (str(state), action, reward)
+            for state, action, reward in stats["best_solution"] or []
+        ],
+        "knowledge_graph": stats["knowledge_graph"],
+        "q_table": agent.to_dict(),
+    }
+
+
+def merge_q_tables(q_tables: Sequence[Dict[str, Dict[str, float]]]) -> Dict[str, Dict[str, float]]:
+    """
+    Merge Q-tables keyed by state string and action by averaging every
+    (state, action) value over the tables that contain it.
+    """
+    totals: Dict[str, Dict[str, float]] = {}
+    counts: Dict[Tuple[str, str], int] = {}
+    for q_table in q_tables:
+        for state, actions in q_table.items():
+            merged = totals.setdefault(state, {})
+            for action, value in actions.items():
+                merged[action] = merged.get(action, 0.0) + value
+                counts[state, action] = counts.get((state, action), 0) + 1
+    return {
+        state: {action: value / counts[state, action] for action, value in actions.items()}
+        for state, actions in totals.items()
+    }
+
+
+def agent_from_q_table(q_table: Dict[str, Dict[str, float]], **kwargs) -> QLearningAgent:
+    """QLearningAgent (keyed by state strings) with the given Q-values."""
+    agent = QLearningAgent(**kwargs)
+    for state, actions in q_table.items():
+        agent.q_table[state].update(actions)
+    return agent
+
+
+class ParallelRLTrainer:
+    """Trains independent agents on many problems across a process pool."""
+
+    def __init__(
+        self,
+        problems: Sequence[Tuple[str, int]],
+        env: Literal["addition", "multiple_addition"] = "addition",
+        num_episodes: int = 1000,
+        seeds: Sequence[int] = (0,),
+        max_steps: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        learning_rate: float = 0.1,
+        discount_factor: float = 0.9,
+        exploration_rate: float = 0.3,
+    ):
+        """
+        Initialize the trainer.
+
+        Args:
+            problems: (expression, target result) pairs, e.g. ("8 + 4", 12)
+            env: Environment of every problem
+            num_episodes: Number of training episodes per problem and seed
+            seeds: Seeds to train every problem with
+            max_steps: Maximum steps per episode; the environment's default
+                if None
+            max_workers: Number of worker processes; the number of CPUs if None
+            learning_rate: Alpha - learning rate of every agent
+            discount_factor: Gamma - discount factor of every agent
+            exploration_rate: Epsilon - initial exploration rate of every agent
+        """
+        if env not in ENVIRONMENTS:
+            raise ValueError(f"Unknown environment {env!r}, expected one of {list(ENVIRONMENTS)}")
+        self.tasks = [
+            {
+                "env": env,
+                "expression": expression,
+                "target_result": target_result,
+                "seed": seed,
+                "num_episodes": num_episodes,
+                "max_steps": max_steps,
+                "agent_kwargs": {
+                    "learning_rate": learning_rate,
+                    "discount_factor": discount_factor,
+                    "exploration_rate": exploration_rate,
+                },
+            }
+            for expression, target_result in problems
+            for seed in seeds
+        ]
+        self.max_workers = max_workers
+
+    def train(self, merge: bool = True, chunksize: int = 1) -> Dict[str, Any]:
+        """
+        Train one agent per problem and seed in worker processes.
+
+        Args:
+            merge: Whether to merge the Q-tables of all the agents with
+                merge_q_tables; per-task tables are kept in the results either way
+            chunksize: Number of tasks sent to a worker at a time; raise it
+                for many short tasks
+
+        Returns:
+            "results": the statistics of every task, in the order of the
+            problems and then of the seeds, each with its "q_table" keyed by
+            state string; "q_table": the merged table, or None
+        """
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(_train_task, self.tasks, chunksize=chunksize))
+        return {
+            "results": results,
+            "q_table": (
+                merge_q_tables([result["q_table"] for result in results]) if merge else None
+            ),
+        }
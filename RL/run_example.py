@@ -67,7 +67,7 @@ def solve_addition_problem(a: int, b: int, num_episodes: int = 1000) -> Dict[str
         current_expr = f"(({a} + {b-2}) + 1) + 1"
 
         while current_b > 0:
-            next_expr = f"({current_expr.replace(f'{a} + {current_b}', f'({a} + {current_b-1}) + 1')}"
+            next_expr = current_expr.replace(f"{a} + {current_b}", f"({a} + {current_b-1}) + 1")
             manual_path.append(
                 (MathExpressionState(next_expr), "further_decompose", 1.0)
             )
@@ -120,9 +120,9 @@ def store_graph_in_neo4j(solution: Dict[str, Any], problem_name: str) -> None:
     # Use the credentials from your docker-compose.yml
     neo4j = Neo4JUtils("bolt://localhost:7687", ("neo4j", "password"))
 
-    # Clean the database to remove any existing nodes and relationships
-    print("Cleaning Neo4j database...")
-    neo4j.clean_database()
+    # Remove any nodes and relationships stored earlier for this problem
+    print(f"Cleaning previous '{problem_name}' graph from Neo4j...")
+    neo4j.clean_database(problem=problem_name)
 
     # Extract entities and relations from the solution
     knowledge_graph = solution["knowledge_graph"]
@@ -158,7 +158,11 @@ def store_graph_in_neo4j(solution: Dict[str, Any], problem_name: str) -> None:
                 "problem": problem_name,
             }
             neo4j.create_relation_with_ids(
-                relation["source"], relation["target"], relation["type"], properties
+                relation["source"],
+                relation["target"],
+                relation["type"],
+                properties,
+                problem=problem_name,
             )
 
         print("Graph stored successfully in Neo4j!")
@@ -4,8 +4,9 @@ import numpy as np
 from tqdm import tqdm
 
 from .environment import AdditionRecursionEnv
-from .agent import QLearningAgent
+from .agent import ArrayQLearningAgent, QLearningAgent
 from .graph_builder import KnowledgeGraphBuilder
+from .vector_env import VectorEnv
 
 
 class RLTrainer:
@@ -34,19 +35,22 @@ class RLTrainer:
         self.best_reward = float("-inf")
         self.best_solution = None
 
-    def train(self, verbose: bool = False) -> Dict[str, Any]:
+    def train(self, verbose: bool = False, progress_bar: bool = True) -> Dict[str, Any]:
         """
         Train the agent.
 
         Args:
             verbose: Whether to print progress
+            progress_bar: Whether to show a progress bar
 
         Returns:
             Training statistics
         """
         episode_rewards = []
 
-        for episode in tqdm(range(self.num_episodes), desc="Training"):
+        for episode in tqdm(
+            range(self.num_episodes), desc="Training", disable=not progress_bar
+        ):
             state = self.env.reset()
             done = False
             total_reward = 0
@@ -92,6 +96,100 @@ class RLTrainer:
             ),
         }
 
+    def train_vectorized(
+        self, vector_env: VectorEnv, verbose: bool = False, progress_bar: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Train the agent on all the environments of ``vector_env`` at once,
+        choosing actions and updating Q-values for the whole batch with
+        array operations. Finished environments are reset, so training stops
+        once ``num_episodes`` episodes have finished in total.
+
+        Args:
+            vector_env: The environments to train on
+            verbose: Whether to print progress
+            progress_bar: Whether to show a progress bar
+
+        Returns:
+            Training statistics, as returned by train
+        """
+        if not isinstance(self.agent, ArrayQLearningAgent):
+            raise TypeError("train_vectorized needs an ArrayQLearningAgent")
+        agent = self.agent
+        finish = agent.action_id("finish")
+        action_ids = np.array([agent.action_id(a) for a in vector_env.actions])
+        env_actions = np.zeros(agent.q_values.shape[1], dtype=np.int64)
+        env_actions[action_ids] = np.arange(len(action_ids))
+
+        episode_rewards = []
+        totals = np.zeros(vector_env.num_envs)
+        histories = [[] for _ in range(vector_env.num_envs)]
+        states = vector_env.reset()
+        state_ids = agent.state_ids_batch(states)
+        valid = agent.record_valid_batch(
+            state_ids, vector_env.get_valid_actions(), vector_env.actions
+        )
+
+        with tqdm(
+            total=self.num_episodes, desc="Training", disable=not progress_bar
+        ) as progress:
+            while len(episode_rewards) < self.num_episodes:
+                # States without valid actions finish, as in get_action
+                valid[~valid.any(axis=1), finish] = True
+                chosen = agent.get_actions_batch(state_ids, valid)
+                next_states, rewards, done, _ = vector_env.step(env_actions[chosen])
+                next_state_ids = agent.state_ids_batch(next_states)
+                next_valid = agent.record_valid_batch(
+                    next_state_ids, vector_env.get_valid_actions(), vector_env.actions
+                )
+                agent.update_batch(
+                    state_ids, chosen, rewards, next_state_ids, done, next_valid
+                )
+
+                totals += rewards
+                for i in range(vector_env.num_envs):
+                    histories[i].append(
+                        (states[i], agent.actions[chosen[i]], float(rewards[i]))
+                    )
+                finished = np.flatnonzero(done)
+                for i in finished:
+                    episode = len(episode_rewards)
+                    episode_rewards.append(float(totals[i]))
+                    if totals[i] > self.best_reward:
+                        self.best_reward = float(totals[i])
+                        self.best_solution = histories[i]
+                    if episode % 100 == 0:
+                        agent.decay_exploration()
+                    if verbose and episode % 100 == 0:
+                        print(
+                            f"Episode {episode}, Reward: {totals[i]}, Epsilon: {agent.epsilon:.4f}"
+                        )
+                    totals[i] = 0
+                    histories[i] = []
+                progress.update(len(finished))
+
+                if len(finished):
+                    next_states = vector_env.reset(finished)
+                    next_state_ids[finished] = agent.state_ids_batch(next_states[finished])
+                    next_valid[finished] = agent.record_valid_batch(
+                        next_state_ids[finished],
+                        vector_env.get_valid_actions(finished),
+                        vector_env.actions,
+                    )
+                states, state_ids, valid = next_states, next_state_ids, next_valid
+
+        if self.best_solution:
+            self.graph_builder.build_graph_from_solution(self.best_solution)
+
+        return {
+            "episode_rewards": episode_rewards[: self.num_episodes],
+            "best_reward": self.best_reward,
+            "best_solution": self.best_solution,
+            "knowledge_graph": (
+                self.graph_builder.export_to_triplets() if self.best_solution else None
+            ),
+        }
+
     def solve_problem(
         self, problem_expression: str, target_result: int
     ) -> Dict[str, Any]:
@@ -0,0 +1,92 @@
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from environment import AdditionRecursionEnv
+from multiple_addition_env import MultipleAdditionEnv
+
+
+class VectorEnv:
+    """Steps N independent environments of the same class in lock-step."""
+
+    def __init__(self, envs: List[Any]):
+        """
+        Initialize the vector environment.
+
+        Args:
+            envs: Environments sharing the same ACTIONS, e.g. one
+                AdditionRecursionEnv per (a, b) pair
+        """
+        if not envs:
+            raise ValueError("VectorEnv needs at least one environment")
+        self.envs = envs
+        self.actions = list(envs[0].ACTIONS)
+        self.action_index = {action: i for i, action in enumerate(self.actions)}
+        self.num_envs = len(envs)
+        self.states = np.empty(self.num_envs, dtype=object)
+
+    def reset(self, indices: Optional[Sequence[int]] = None) -> np.ndarray:
+        """
+        Reset the environments at ``indices``, or all of them.
+
+        Returns:
+            Current state of every environment
+        """
+        if indices is None:
+            indices = range(self.num_envs)
+        for i in indices:
+            self.states[i] = self.envs[i].reset()
+        return self.states.copy()
+
+    def get_valid_actions(self, indices: Optional[Sequence[int]] = None) -> np.ndarray:
+        """
+        Valid actions of the environments at ``indices``, or of all of them.
+
+        Returns:
+            Boolean mask of shape (len(indices), len(actions))
+        """
+        if indices is None:
+            indices = range(self.num_envs)
+        mask = np.zeros((len(indices), len(self.actions)), dtype=bool)
+        for row, i in enumerate(indices):
+            for action in self.envs[i].get_valid_actions():
+                mask[row, self.action_index[action]] = True
+        return mask
+
+    def step(
+        self, actions: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Dict[str, Any]]]:
+        """
+        Take one step in every environment. Finished environments are not
+        reset automatically; call reset with their indices.
+
+        Args:
+            actions: Index into ``actions`` of the action of every environment
+
+        Returns:
+            next_states: New state of every environment
+            rewards: Reward of every environment
+            done: Whether the episode of every environment is done
+            infos: Additional information of every environment
+        """
+        rewards = np.empty(self.num_envs)
+        done = np.empty(self.num_envs, dtype=bool)
+        infos = []
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            self.states[i], rewards[i], done[i], info = env.step(self.actions[action])
+            infos.append(info)
+        return self.states.copy(), rewards, done, infos
+
+
+def make_addition_vector_env(problems: Sequence[Tuple[int, int]]) -> VectorEnv:
+    """Vector environment with one AdditionRecursionEnv per (a, b) pair."""
+    return VectorEnv([AdditionRecursionEnv(f"{a} + {b}", a + b) for a, b in problems])
+
+
+def make_multiple_addition_vector_env(problems: Sequence[Sequence[int]]) -> VectorEnv:
+    """Vector environment with one MultipleAdditionEnv per list of numbers."""
+    return VectorEnv(
+        [
+            MultipleAdditionEnv(" + ".join(str(n) for n in numbers), sum(numbers))
+            for numbers in problems
+        ]
+    )
@@ -0,0 +1,114 @@
+"""
+Benchmark edge-insert latency as the graph grows.
+
+Grows a scratch graph (graph_type "benchmark") from 1k to 100k nodes and, at
+each size, times inserting edges one transaction at a time with the
+label-qualified MATCH used by Neo4JUtils. Pass --compare-unlabelled to also
+time the previous unlabelled ``MATCH (a {id: ...})`` query, whose cost grows
+with the number of nodes in the database.
+
+Usage:
+    python benchmarks/neo4j_edge_insert.py --uri bolt://localhost:7687 \\
+        --user neo4j --password password
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.neo4j_utils import NODE_LABEL, Neo4JUtils
+
+GRAPH_TYPE = "benchmark"
+SIZES = (1_000, 10_000, 50_000, 100_000)
+
+UNLABELLED_EDGE_QUERY = (
+    "MATCH (a {id: $source_id}), (b {id: $target_id}) "
+    "CREATE (a)-[r:BENCH_EDGE {graph_type: $graph_type}]->(b)"
+)
+
+
+def labelled_edge_query() -> str:
+    return (
+        f"MATCH (a:{NODE_LABEL} {{id: $source_id}}), "
+        f"(b:{NODE_LABEL} {{id: $target_id}}) "
+        "CREATE (a)-[r:BENCH_EDGE {graph_type: $graph_type}]->(b)"
+    )
+
+
+def grow_graph(neo4j: Neo4JUtils, start: int, end: int) -> None:
+    """Create benchmark nodes with ids in [start, end)."""
+    rows = [
+        {"id": f"{GRAPH_TYPE}_{i}", "graph_type": GRAPH_TYPE}
+        for i in range(start, end)
+    ]
+    statements = Neo4JUtils._batch_statements(
+        Neo4JUtils._create_nodes_query(f"{GRAPH_TYPE}_Node"), rows, 10_000
+    )
+    with neo4j.driver.session() as session:
+        for query, params in statements:
+            session.execute_write(lambda tx: tx.run(query, params).consume())
+
+
+def time_edges(neo4j: Neo4JUtils, query: str, num_nodes: int, num_edges: int) -> float:
+    """Insert ``num_edges`` random edges one transaction each; return ms per edge."""
+    pairs = [
+        (random.randrange(num_nodes), random.randrange(num_nodes))
+        for _ in range(num_edges)
+    ]
+    started = time.perf_counter()
+    with neo4j.driver.session() as session:
+        for source, target in pairs:
+            session.execute_write(
+                lambda tx: tx.run(
+                    query,
+                    source_id=f"{GRAPH_TYPE}_{source}",
+                    target_id=f"{GRAPH_TYPE}_{target}",
+                    graph_type=GRAPH_TYPE,
+                ).consume()
+            )
+    return (time.perf_counter() - started) * 1000 / num_edges
+
+
+def remove_benchmark_nodes(neo4j: Neo4JUtils) -> None:
+    """Delete the scratch graph in bounded batches."""
+    neo4j.clean_database(graph_type=GRAPH_TYPE)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uri", default="bolt://localhost:7687")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--edges", type=int, default=500, help="Edges timed per size")
+    parser.add_argument("--compare-unlabelled", action="store_true")
+    args = parser.parse_args()
+
+    neo4j = Neo4JUtils(args.uri, (args.user, args.password))
+    remove_benchmark_nodes(neo4j)
+
+    header = f"{'nodes':>8} | {'labelled ms/edge':>16}"
+    if args.compare_unlabelled:
+        header += f" | {'unlabelled ms/edge':>18}"
+    print(header)
+    print("-" * len(header))
+
+    num_nodes = 0
+    try:
+        for size in SIZES:
+            grow_graph(neo4j, num_nodes, size)
+            num_nodes = size
+            row = f"{size:>8} | {time_edges(neo4j, labelled_edge_query(), size, args.edges):>16.3f}"
+            if args.compare_unlabelled:
+                row += f" | {time_edges(neo4j, UNLABELLED_EDGE_QUERY, size, args.edges):>18.3f}"
+            print(row)
+    finally:
+        remove_benchmark_nodes(neo4j)
+        neo4j.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Report prompt token counts before and after the prompt restructuring.
+
+Phase 1: for every ``proof*.tex`` under data/proofs, counts the tokens of the
+triplet extraction prompt and of its static prefix (everything before the
+proof), which is the part the provider can serve from its prompt cache. The
+previous template placed the proof in the middle, so only the text before it
+was cacheable.
+
+Phase 2: for every Triplet saved as text (``*Triplet*.txt`` under data/proofs
+and Triplet reprs in notebook outputs), counts the tokens of the resolution
+prompt built from the Python repr of the models versus the compact TSV rows
+with short ids.
+
+Usage:
+    python benchmarks/prompt_tokens.py [--model gpt-4o-mini]
+"""
+
+import argparse
+import ast
+import glob
+import json
+import os
+import re
+import sys
+
+from pydantic import ValidationError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from src.phase1.prompts import TRIPLET_EXTRACTION_PROMPT
+from src.phase1.schemas import Entity, Relation, Triplet
+from src.phase2.prompts import RESOLUTION_PROMPT
+from src.phase2.serialization import (
+    serialize_entities,
+    serialize_relations,
+    shorten_ids,
+)
+from src.utils.llm_utils import count_tokens
+
+PREVIOUS_TRIPLET_EXTRACTION_PROMPT = """
+Extract entities and relations from the following LaTeX proof. Return the output in JSON format.
+
+LaTeX Proof:
+{proof}
+
+Entities should include axioms, lemmas, and conclusions. Relations should describe connections between them, such as "grounds" or "explains".
+"""
+
+PREVIOUS_RESOLUTION_PROMPT = """
+Resolve the following entities and relations into a directed acyclic graph (DAG).
+
+Entities:
+{entities}
+
+Relations:
+{relations}
+
+Return the resolved graph in JSON format.
+"""
+
+QUOTED = r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\""
+MODEL_PATTERN = re.compile(rf"\b(Entity|Relation)\(((?:{QUOTED}|[^()'\"])*)\)")
+FIELD_PATTERN = re.compile(rf"(\w+)=({QUOTED}|None)")
+
+
+def parse_triplet_repr(text: str) -> Triplet:
+    """Rebuild a Triplet from its printed repr without evaluating code."""
+    entities, relations = [], []
+    for kind, fields in MODEL_PATTERN.findall(text):
+        values = {
+            name: ast.literal_eval(value) for name, value in FIELD_PATTERN.findall(fields)
+        }
+        try:
+            model = Entity(**values) if kind == "Entity" else Relation(**values)
+        except ValidationError:
+            # Not a printed model, e.g. source code mentioning Entity(...)
+            continue
+        (entities if kind == "Entity" else relations).append(model)
+    return Triplet(entities=entities, relations=relations)
+
+
+def notebook_outputs(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            notebook = json.load(f)
+    except (OSError, ValueError):
+        return
+    for cell in notebook.get("cells", []):
+        for output in cell.get("outputs", []):
+            text = output.get("text") or output.get("data", {}).get("text/plain", "")
+            yield "".join(text) if isinstance(text, list) else text
+
+
+def load_triplets():
+    sources = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "data/proofs/**/*Triplet*.txt"), recursive=True)):
+        with open(path, encoding="utf-8") as f:
+            sources.append((path, f.read()))
+    for path in sorted(glob.glob(os.path.join(ROOT, "notebooks/**/*.ipynb"), recursive=True)):
+        for text in notebook_outputs(path):
+            if "Entity(" in text:
+                sources.append((path, text))
+
+    for path, text in sources:
+        triplet = parse_triplet_repr(text)
+        if triplet.entities:
+            yield os.path.relpath(path, ROOT), triplet
+
+
+def static_prefix(template: str, placeholder: str) -> str:
+    return template[: template.index("{" + placeholder + "}")]
+
+
+def report_extraction(model: str) -> None:
+    print("Phase 1: triplet extraction prompt (tokens: total / cacheable prefix)")
+    before_prefix = count_tokens(static_prefix(PREVIOUS_TRIPLET_EXTRACTION_PROMPT, "proof"), model)
+    after_prefix = count_tokens(static_prefix(TRIPLET_EXTRACTION_PROMPT, "proof"), model)
+    paths = sorted(glob.glob(os.path.join(ROOT, "data/proofs/**/proof*.tex"), recursive=True))
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            proof = f.read()
+        before = count_tokens(PREVIOUS_TRIPLET_EXTRACTION_PROMPT.format(proof=proof), model)
+        after = count_tokens(TRIPLET_EXTRACTION_PROMPT.format(proof=proof), model)
+        print(
+            f"  {os.path.relpath(path, ROOT):<60} "
+            f"{before:>6} / {before_prefix:<4} -> {after:>6} / {after_prefix}"
+        )
+
+
+def report_resolution(model: str) -> None:
+    print("Phase 2: resolution prompt (tokens: repr -> compact)")
+    total_before = total_after = 0
+    for name, triplet in load_triplets():
+        before = count_tokens(
+            PREVIOUS_RESOLUTION_PROMPT.format(
+                entities=triplet.entities, relations=triplet.relations
+            ),
+            model,
+        )
+        compact, _ = shorten_ids(triplet)
+        after = count_tokens(
+            RESOLUTION_PROMPT.format(
+                entities=serialize_entities(compact.entities),
+                relations=serialize_relations(compact.relations),
+            ),
+            model,
+        )
+        total_before += before
+        total_after += after
+        print(f"  {name[-60:]:<60} {before:>6} -> {after:>6} ({after / before:.0%})")
+    if total_before:
+        print(f"  {'total':<60} {total_before:>6} -> {total_after:>6} ({total_after / total_before:.0%})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--model", default="gpt-4o-mini")
+    args = parser.parse_args()
+
+    report_extraction(args.model)
+    print()
+    report_resolution(args.model)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare the expression evaluator of the RL environments with ``eval``.
+
+Trains a Q-learning agent on addition via recursion problems ("a + b") and
+on multiple addition problems, once with the environments' cached evaluator
+and once with ``eval`` on the expression string, the previous
+implementation. Both runs use the same seed and take the same steps, so
+only the evaluation differs.
+
+Usage:
+    python benchmarks/rl_evaluator.py [--episodes 2000] [--b 4 50 300]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "RL"))
+
+import environment
+import multiple_addition_env
+from agent import QLearningAgent
+from environment import AdditionRecursionEnv
+from multiple_addition_env import MultipleAdditionEnv
+
+EVALUATORS = {
+    "evaluate": environment.evaluate,
+    "eval": lambda expression: eval(str(expression)),
+}
+
+
+def use_evaluator(name: str) -> None:
+    environment.evaluate = EVALUATORS[name]
+    multiple_addition_env.evaluate = EVALUATORS[name]
+
+
+def train(env, episodes: int, seed: int = 0) -> float:
+    """Seconds taken by a Q-learning training loop, as in RLTrainer.train."""
+    random.seed(seed)
+    agent = QLearningAgent(exploration_rate=0.3)
+    start = time.perf_counter()
+    for episode in range(episodes):
+        state = env.reset()
+        done = False
+        while not done:
+            valid_actions = env.get_valid_actions()
+            action = agent.get_action(state, valid_actions)
+            next_state, reward, done, _ = env.step(action)
+            next_valid_actions = env.get_valid_actions() if not done else []
+            agent.update(state, action, reward, next_state, next_valid_actions)
+            state = next_state
+        agent.action_history = []
+        if episode % 100 == 0:
+            agent.decay_exploration()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--episodes", type=int, default=2000)
+    parser.add_argument("--b", type=int, nargs="+", default=[4, 50, 300])
+    args = parser.parse_args()
+
+    problems = [
+        (f"7 + {b}", lambda b=b: AdditionRecursionEnv(f"7 + {b}", 7 + b, max_steps=b + 10))
+        for b in args.b
+    ]
+    problems.append(
+        ("2 + 3 + 4 + 5 + 6", lambda: MultipleAdditionEnv("2 + 3 + 4 + 5 + 6", 20))
+    )
+    print(f"{'problem':<20} {'eval (s)':>10} {'evaluate (s)':>13} {'speedup':>8}")
+    for name, make_env in problems:
+        seconds = {}
+        for evaluator in ("eval", "evaluate"):
+            use_evaluator(evaluator)
+            seconds[evaluator] = train(make_env(), args.episodes)
+        use_evaluator("evaluate")
+        print(
+            f"{name:<20} {seconds['eval']:>10.2f} {seconds['evaluate']:>13.2f} "
+            f"{seconds['eval'] / seconds['evaluate']:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
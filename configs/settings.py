@@ -3,7 +3,42 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_LLM_MODEL = os.getenv("OPENAI_LLM_MODEL", "gpt-4o-mini")
 OPENAI_MODEL_PROVIDER = os.getenv("OPENAI_MODEL_PROVIDER", "openai")
 OPENAI_LLM_TEMPERATURE = float(os.getenv("OPENAI_LLM_TEMPERATURE", 0.0))
+# Optional OpenAI-compatible endpoint, e.g. a local stub server for tests
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
+
+# Budgets for concurrent batch extraction (see src/utils/llm_utils.py)
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 8))
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 500))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", 200000))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 5))
+
+# On-disk cache of structured LLM responses (see src/utils/llm_utils.py)
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH", os.path.join(PROJECT_ROOT, ".cache", "llm_responses.sqlite")
+)
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Persisted state of the incremental entity clusterer (see
+# src/phase2/incremental_clustering.py)
+ENTITY_INDEX_PATH = os.getenv(
+    "ENTITY_INDEX_PATH", os.path.join(PROJECT_ROOT, ".cache", "entity_index.json")
+)
+
+# Entity label embeddings (see src/phase2/embeddings.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hashing")
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(PROJECT_ROOT, ".cache", "embeddings.sqlite")
+)
+
+# Shared Neo4j driver pool (see src/utils/neo4j_drivers.py)
+NEO4J_MAX_CONNECTION_POOL_SIZE = int(os.getenv("NEO4J_MAX_CONNECTION_POOL_SIZE", 100))
+NEO4J_CONNECTION_ACQUISITION_TIMEOUT = float(
+    os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", 60.0)
+)
+NEO4J_LIVENESS_CHECK_TIMEOUT = float(os.getenv("NEO4J_LIVENESS_CHECK_TIMEOUT", 30.0))
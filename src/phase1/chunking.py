@@ -0,0 +1,234 @@
+# Chunking of long LaTeX proofs and stitching of per-chunk triplets
+import re
+from typing import Dict, List, Tuple
+
+from .schemas import Entity, Relation, Triplet
+
+# Environments that wrap a whole document and never bound a chunk
+TRANSPARENT_ENVIRONMENTS = {"document"}
+
+# \begin{...}, \end{...}, sectioning commands and blank lines
+_BOUNDARY_PATTERN = re.compile(
+    r"\\begin\{([^}]*)\}|\\end\{([^}]*)\}|(?=\\(?:sub)*section\*?\{)|\n[ \t]*\n"
+)
+
+
+def _split_units(latex: str) -> List[str]:
+    """
+    Split LaTeX into units that may be placed in different chunks: top-level
+    environments (e.g. a whole ``proof`` or ``equation``), sections and
+    paragraphs. Nothing is split inside a non-transparent environment.
+    """
+    units = []
+    depth = 0
+    start = 0
+    for match in _BOUNDARY_PATTERN.finditer(latex):
+        begin, end = match.group(1), match.group(2)
+        if begin is not None:
+            if begin in TRANSPARENT_ENVIRONMENTS:
+                continue
+            if depth == 0 and match.start() > start:
+                units.append(latex[start : match.start()])
+                start = match.start()
+            depth += 1
+        elif end is not None:
+            if end in TRANSPARENT_ENVIRONMENTS:
+                continue
+            depth = max(depth - 1, 0)
+            if depth == 0:
+                units.append(latex[start : match.end()])
+                start = match.end()
+        elif depth == 0 and match.end() > start:
+            # Paragraph break or the start of a section heading
+            units.append(latex[start : match.end()])
+            start = match.end()
+    units.append(latex[start:])
+    # Keep whitespace-only units (e.g. a blank line after an environment)
+    # attached to the preceding unit so no text is lost
+    merged: List[str] = []
+    for unit in units:
+        if merged and not unit.strip():
+            merged[-1] += unit
+        elif unit:
+            merged.append(unit)
+    return merged
+
+
+# A unit made of one environment: opening line, body and closing command
+_ENVIRONMENT_PATTERN = re.compile(
+    r"(\s*\\begin\{([^}]*)\}[^\n]*\n?)(.*)(\\end\{\2\}\s*)", re.DOTALL
+)
+
+
+def _split_oversized(unit: str, max_chars: int) -> List[str]:
+    """
+    Split a unit larger than ``max_chars`` into chunks of at most
+    ``max_chars``. An environment such as a whole ``proof`` is opened up,
+    its body re-split at its own paragraph and nested environment boundaries
+    (recursively, or at line ends when it has none), the pieces packed and
+    every packed chunk wrapped in the environment's own ``\begin``/``\end``
+    pair, so each chunk stays well-formed.
+    """
+    match = _ENVIRONMENT_PATTERN.fullmatch(unit)
+    if match is None:
+        return _pack(_split_lines(unit, max_chars), max_chars)
+    head, _, body, tail = match.groups()
+    budget = max_chars - len(head) - len(tail)
+    if budget < 1:
+        return _pack(_split_lines(unit, max_chars), max_chars)
+
+    inner_units = _split_units(body)
+    if len(inner_units) <= 1:
+        pieces = _split_lines(body, budget)
+    else:
+        pieces = []
+        for inner in inner_units:
+            if len(inner) > budget:
+                pieces.extend(_split_oversized(inner, budget))
+            else:
+                pieces.append(inner)
+    return [head + piece + tail for piece in _pack(pieces, budget)]
+
+
+def _pack(pieces: List[str], max_chars: int) -> List[str]:
+    """Greedily concatenate consecutive pieces into chunks of at most max_chars."""
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+# Whitespace after the end of a sentence
+_SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s")
+
+
+def _line_break(line: str, max_chars: int) -> int:
+    """
+    Position at which to cut an overlong line so the first part has at most
+    ``max_chars`` characters: after the last sentence end outside inline
+    math, else after the last whitespace outside inline math, else after
+    the last whitespace, else at ``max_chars``.
+    """
+    prefix = line[: max_chars + 1]
+    # Inline math is open where an odd number of unescaped $ precede
+    dollars = [match.start() for match in re.finditer(r"(?<!\\)\$", prefix)]
+
+    def outside_math(position: int) -> bool:
+        return sum(1 for dollar in dollars if dollar < position) % 2 == 0
+
+    sentence_ends = [m.end() for m in _SENTENCE_END_PATTERN.finditer(prefix)]
+    spaces = [m.end() for m in re.finditer(r"\s", prefix)]
+    for candidates in (
+        [p for p in sentence_ends if outside_math(p)],
+        [p for p in spaces if outside_math(p)],
+        spaces,
+    ):
+        candidates = [p for p in candidates if 0 < p <= max_chars]
+        if candidates:
+            return candidates[-1]
+    return max_chars
+
+
+def _split_lines(unit: str, max_chars: int) -> List[str]:
+    """
+    Split an oversized unit at line ends, then break overlong lines at
+    sentence or word boundaries (see _line_break).
+    """
+    pieces = []
+    for line in unit.splitlines(keepends=True):
+        while len(line) > max_chars:
+            cut = _line_break(line, max_chars)
+            pieces.append(line[:cut])
+            line = line[cut:]
+        pieces.append(line)
+    return pieces
+
+
+def split_latex_proof(latex: str, max_chars: int = 4000) -> List[str]:
+    """
+    Split a LaTeX proof into chunks of at most ``max_chars`` characters along
+    environment (e.g. ``\\begin{proof}``), section and paragraph boundaries.
+
+    Consecutive units are packed greedily into a chunk. A single environment
+    larger than ``max_chars`` is re-split at the paragraph and environment
+    boundaries inside it and every resulting chunk is wrapped in the
+    environment's ``\\begin``/``\\end`` pair; text without such boundaries
+    is split at line ends and then at sentence or word boundaries as a last
+    resort.
+
+    Args:
+        latex: Content of the LaTeX proof
+        max_chars: Maximum number of characters per chunk
+
+    Returns:
+        List of chunks, in document order
+    """
+    if max_chars < 1:
+        raise ValueError("max_chars must be a positive integer.")
+
+    pieces = []
+    for unit in _split_units(latex):
+        if len(unit) > max_chars:
+            pieces.extend(_split_oversized(unit, max_chars))
+        else:
+            pieces.append(unit)
+
+    return _pack(pieces, max_chars)
+
+
+def _entity_key(entity: Entity) -> str:
+    """Normalized entity name used to match entities across chunks."""
+    name = entity.name.lower().replace("$", "")
+    name = re.sub(r"[^\w\\+\-*/=^(){}]+", " ", name)
+    return " ".join(name.split())
+
+
+def stitch_triplets(triplets: List[Triplet]) -> Triplet:
+    """
+    Stitch per-chunk triplets into one graph.
+
+    Ids are only unique within a chunk, so every entity gets the id
+    ``c{chunk}_{id}``, except that entities whose normalized names match an
+    entity of an earlier chunk are merged into it. Relations are remapped to
+    the stitched ids; duplicates and self-loops created by merging are dropped.
+
+    Args:
+        triplets: Triplets extracted from consecutive chunks
+
+    Returns:
+        The stitched Triplet
+    """
+    entities: List[Entity] = []
+    ids_by_key: Dict[str, str] = {}
+    relations: List[Relation] = []
+    seen_relations = set()
+
+    for chunk_index, triplet in enumerate(triplets):
+        id_map: Dict[str, str] = {}
+        for entity in triplet.entities:
+            key = _entity_key(entity)
+            stitched_id = ids_by_key.get(key)
+            if stitched_id is None:
+                stitched_id = f"c{chunk_index}_{entity.id}"
+                ids_by_key[key] = stitched_id
+                entities.append(entity.model_copy(update={"id": stitched_id}))
+            id_map[entity.id] = stitched_id
+
+        for relation in triplet.relations:
+            source = id_map.get(relation.source, f"c{chunk_index}_{relation.source}")
+            target = id_map.get(relation.target, f"c{chunk_index}_{relation.target}")
+            relation_key: Tuple[str, str, str] = (source, target, relation.name)
+            if source == target or relation_key in seen_relations:
+                continue
+            seen_relations.add(relation_key)
+            relations.append(
+                relation.model_copy(update={"source": source, "target": target})
+            )
+
+    return Triplet(entities=entities, relations=relations)
@@ -1,4 +1,18 @@
 # Main script for triplet extraction
+import asyncio
+import logging
+from typing import (
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Type,
+    TypeVar,
+    Union,
+)
+
 from langchain.chat_models import init_chat_model
 from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
@@ -6,80 +20,528 @@ from langchain.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 from langchain.output_parsers import PydanticOutputParser
 
-from configs.settings import OPENAI_API_KEY, OPENAI_LLM_MODEL, OPENAI_LLM_TEMPERATURE
-from .schemas import Triplet, CalculationGraph
+from configs.settings import (
+    OPENAI_LLM_MODEL,
+    OPENAI_LLM_TEMPERATURE,
+    OPENAI_MAX_CONCURRENCY,
+    OPENAI_MAX_RETRIES,
+    OPENAI_REQUESTS_PER_MINUTE,
+    OPENAI_TOKENS_PER_MINUTE,
+)
+from src.utils.llm_utils import (
+    LLMResponseCache,
+    RateLimiter,
+    call_with_retries,
+    call_with_retries_sync,
+    estimate_tokens,
+    get_chat_model,
+    get_default_cache,
+)
+from src.utils.llm_metrics import LLMCallRecord, get_default_metrics
+from .chunking import split_latex_proof, stitch_triplets
+from .schemas import Entity, Relation, Triplet, CalculationGraph
 from .prompts import (
     TRIPLET_EXTRACTION_PROMPT,
+    TRIPLET_EXTRACTION_SYSTEM_MESSAGE,
     CALCULATION_GRAPH_EXTRACTION_PROMPT,
     CALCULATION_GRAPH_SYSTEM_MESSAGE,
 )
 
+logger = logging.getLogger(__name__)
+
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def extract_structured(
+    schema: Type[ModelT],
+    custom_prompt: str,
+    system_message: str,
+    use_cache: bool = True,
+    call: str = "extract_structured",
+) -> ModelT:
+    """
+    Extract a ``schema`` object for a formatted prompt, going through the
+    response cache, the retry policy and the LLM metrics (recorded as
+    ``call``).
+    """
+    # Return the cached response for identical inputs without calling the API
+    cache = get_default_cache() if use_cache else None
+    cache_key = LLMResponseCache.make_key(
+        system_message,
+        custom_prompt,
+        OPENAI_LLM_MODEL,
+        OPENAI_LLM_TEMPERATURE,
+        schema,
+    )
+    with get_default_metrics().track(call) as record:
+        if cache is not None:
+            cached = cache.get(cache_key, schema)
+            if cached is not None:
+                record.cache_hit = True
+                return cached
+
+        # Reuse the shared LLM client
+        llm = get_chat_model()
+
+        # Define the prompt
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                SystemMessage(content=system_message),
+                HumanMessage(content=custom_prompt),
+            ]
+        )
+
+        # Format the prompt into a list of BaseMessages
+        formatted_prompt = prompt.format_messages()
+
+        logger.debug("%s prompt: %s", call, formatted_prompt)
+
+        # Use with_structured_output to enforce the schema
+        structured_llm = llm.with_structured_output(schema)
+
+        # Invoke the LLM with the formatted prompt, recording token usage
+        result = call_with_retries_sync(
+            lambda: structured_llm.invoke(
+                formatted_prompt,
+                config={"callbacks": [record.usage_callback()]},
+            ),
+            OPENAI_MAX_RETRIES,
+            on_retry=record.count_retry,
+        )
+
+    if cache is not None:
+        cache.set(cache_key, result)
+
+    return result
+
 
 def extract_triplets(
     custom_prompt: str = TRIPLET_EXTRACTION_PROMPT,
-    system_message: str = "You are a helpful assistant that extracts entities and relations from mathematical proofs.",
+    system_message: str = TRIPLET_EXTRACTION_SYSTEM_MESSAGE,
+    use_cache: bool = True,
 ) -> Triplet:
-    # Initialize the LLM
-    llm = ChatOpenAI(
-        model_name=OPENAI_LLM_MODEL,
-        temperature=OPENAI_LLM_TEMPERATURE,
-        openai_api_key=OPENAI_API_KEY,
+    return extract_structured(
+        Triplet, custom_prompt, system_message, use_cache, "extract_triplets"
     )
 
-    # Format the custom prompt with the proof content
-    # formatted_custom_prompt = custom_prompt.format(proof=proof)
-    formatted_custom_prompt = custom_prompt
 
-    # Define the prompt
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            SystemMessage(content=system_message),
-            HumanMessage(content=formatted_custom_prompt),
-        ]
+def extract_calculation_graph(
+    custom_prompt: str = CALCULATION_GRAPH_EXTRACTION_PROMPT,
+    system_message: str = CALCULATION_GRAPH_SYSTEM_MESSAGE,
+    use_cache: bool = True,
+) -> CalculationGraph:
+    return extract_structured(
+        CalculationGraph,
+        custom_prompt,
+        system_message,
+        use_cache,
+        "extract_calculation_graph",
     )
 
-    # Format the prompt into a list of BaseMessages
-    formatted_prompt = prompt.format_messages()
 
-    print(formatted_prompt)
+async def _extract_batch(
+    schema: Type[ModelT],
+    prompts: List[str],
+    system_message: str,
+    max_concurrency: int,
+    requests_per_minute: int,
+    tokens_per_minute: int,
+    max_retries: int,
+    expected_completion_tokens: int,
+    use_cache: bool,
+    return_exceptions: bool,
+    proof_names: Optional[Sequence[str]] = None,
+    call: Optional[str] = None,
+) -> List[Union[ModelT, BaseException]]:
+    """
+    Extract ``schema`` objects for many prompts concurrently with one shared
+    client, a bounded number of in-flight requests, the requests/tokens per
+    minute budgets and jittered retries of rate-limit and server errors.
+    Each prompt is recorded in the LLM metrics under its ``proof_names`` entry.
+    """
+    if proof_names is not None and len(proof_names) != len(prompts):
+        raise ValueError(
+            f"Got {len(proof_names)} proof_names for {len(prompts)} prompts"
+        )
+    structured_llm = get_chat_model().with_structured_output(schema)
+    cache = get_default_cache() if use_cache else None
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    semaphore = asyncio.Semaphore(max_concurrency)
 
-    # Use with_structured_output to enforce the Triplet schema
-    structured_llm = llm.with_structured_output(Triplet)
+    metrics = get_default_metrics()
+    if call is None:
+        call = (
+            "extract_triplets_batch"
+            if schema is Triplet
+            else "extract_calculation_graphs_batch"
+        )
 
-    # Invoke the LLM with the formatted prompt
-    triplet = structured_llm.invoke(formatted_prompt)
+    async def extract_one(prompt: str, proof_name: Optional[str]) -> ModelT:
+        cache_key = LLMResponseCache.make_key(
+            system_message, prompt, OPENAI_LLM_MODEL, OPENAI_LLM_TEMPERATURE, schema
+        )
+        with metrics.track(call, proof=proof_name) as record:
+            if cache is not None:
+                cached = cache.get(cache_key, schema)
+                if cached is not None:
+                    record.cache_hit = True
+                    return cached
 
-    return triplet
+            messages = [
+                SystemMessage(content=system_message),
+                HumanMessage(content=prompt),
+            ]
+            tokens = estimate_tokens(system_message + prompt) + expected_completion_tokens
 
+            async def invoke() -> ModelT:
+                with record.queued():
+                    await limiter.acquire(tokens)
+                return await structured_llm.ainvoke(
+                    messages, config={"callbacks": [record.usage_callback()]}
+                )
 
-def extract_calculation_graph(
-    custom_prompt: str = CALCULATION_GRAPH_EXTRACTION_PROMPT,
+            with record.queued():
+                await semaphore.acquire()
+            try:
+                result = await call_with_retries(
+                    invoke, max_retries, on_retry=record.count_retry
+                )
+            finally:
+                semaphore.release()
+
+        if cache is not None:
+            cache.set(cache_key, result)
+        return result
+
+    names = list(proof_names) if proof_names is not None else [None] * len(prompts)
+    return await asyncio.gather(
+        *(extract_one(prompt, name) for prompt, name in zip(prompts, names)),
+        return_exceptions=return_exceptions,
+    )
+
+
+async def extract_triplets_batch(
+    prompts: List[str],
+    system_message: str = TRIPLET_EXTRACTION_SYSTEM_MESSAGE,
+    max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+    requests_per_minute: int = OPENAI_REQUESTS_PER_MINUTE,
+    tokens_per_minute: int = OPENAI_TOKENS_PER_MINUTE,
+    max_retries: int = OPENAI_MAX_RETRIES,
+    expected_completion_tokens: int = 1024,
+    use_cache: bool = True,
+    return_exceptions: bool = False,
+    proof_names: Optional[Sequence[str]] = None,
+) -> List[Union[Triplet, BaseException]]:
+    """
+    Extract a Triplet for each formatted prompt concurrently.
+
+    Args:
+        prompts: Formatted extraction prompts, one per proof
+        system_message: System message sent with every prompt
+        max_concurrency: Maximum number of requests in flight
+        requests_per_minute: Requests-per-minute budget
+        tokens_per_minute: Tokens-per-minute budget (prompt estimate plus
+            expected_completion_tokens per request)
+        max_retries: Retries of 429/5xx/connection errors per prompt
+        expected_completion_tokens: Completion tokens reserved per request
+        use_cache: Whether to read and fill the LLM response cache
+        return_exceptions: Return failed prompts' exceptions in place of
+            their results instead of raising the first one
+        proof_names: Name of the proof of each prompt, used to aggregate the
+            LLM metrics per proof (defaults to the one set by track_proof)
+
+    Returns:
+        Triplets in the order of ``prompts``
+
+    Example (in a notebook): ``triplets = await extract_triplets_batch(prompts)``;
+    in a script wrap the call in ``asyncio.run``.
+    """
+    return await _extract_batch(
+        Triplet,
+        prompts,
+        system_message,
+        max_concurrency,
+        requests_per_minute,
+        tokens_per_minute,
+        max_retries,
+        expected_completion_tokens,
+        use_cache,
+        return_exceptions,
+        proof_names,
+    )
+
+
+async def extract_calculation_graphs_batch(
+    prompts: List[str],
     system_message: str = CALCULATION_GRAPH_SYSTEM_MESSAGE,
-) -> CalculationGraph:
-    # Initialize the LLM
-    llm = ChatOpenAI(
-        model_name=OPENAI_LLM_MODEL,
-        temperature=OPENAI_LLM_TEMPERATURE,
-        openai_api_key=OPENAI_API_KEY,
+    max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+    requests_per_minute: int = OPENAI_REQUESTS_PER_MINUTE,
+    tokens_per_minute: int = OPENAI_TOKENS_PER_MINUTE,
+    max_retries: int = OPENAI_MAX_RETRIES,
+    expected_completion_tokens: int = 1024,
+    use_cache: bool = True,
+    return_exceptions: bool = False,
+    proof_names: Optional[Sequence[str]] = None,
+) -> List[Union[CalculationGraph, BaseException]]:
+    """
+    Extract a CalculationGraph for each formatted prompt concurrently.
+
+    Takes the same arguments as extract_triplets_batch and returns the
+    calculation graphs in the order of ``prompts``.
+    """
+    return await _extract_batch(
+        CalculationGraph,
+        prompts,
+        system_message,
+        max_concurrency,
+        requests_per_minute,
+        tokens_per_minute,
+        max_retries,
+        expected_completion_tokens,
+        use_cache,
+        return_exceptions,
+        proof_names,
     )
 
-    # Define the prompt
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            SystemMessage(content=system_message),
-            HumanMessage(content=custom_prompt),
-        ]
+
+async def extract_structured_batch(
+    schema: Type[ModelT],
+    prompts: List[str],
+    system_message: str,
+    max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+    requests_per_minute: int = OPENAI_REQUESTS_PER_MINUTE,
+    tokens_per_minute: int = OPENAI_TOKENS_PER_MINUTE,
+    max_retries: int = OPENAI_MAX_RETRIES,
+    expected_completion_tokens: int = 1024,
+    use_cache: bool = True,
+    return_exceptions: bool = False,
+    proof_names: Optional[Sequence[str]] = None,
+    call: str = "extract_structured_batch",
+) -> List[Union[ModelT, BaseException]]:
+    """
+    Extract a ``schema`` object for each formatted prompt concurrently, the
+    batch counterpart of extract_structured.
+
+    Takes the same arguments as extract_triplets_batch, plus the output
+    ``schema`` and the name the calls are recorded under in the LLM metrics.
+    """
+    return await _extract_batch(
+        schema,
+        prompts,
+        system_message,
+        max_concurrency,
+        requests_per_minute,
+        tokens_per_minute,
+        max_retries,
+        expected_completion_tokens,
+        use_cache,
+        return_exceptions,
+        proof_names,
+        call,
+    )
+
+
+async def extract_triplets_chunked(
+    proof: str,
+    prompt_template: str = TRIPLET_EXTRACTION_PROMPT,
+    system_message: str = TRIPLET_EXTRACTION_SYSTEM_MESSAGE,
+    max_chars: int = 4000,
+    **batch_kwargs,
+) -> Triplet:
+    """
+    Extract a Triplet from a long LaTeX proof chunk by chunk.
+
+    The proof is split along environment, section and paragraph boundaries,
+    a Triplet is extracted per chunk concurrently and the partial graphs are
+    stitched by matching entities across chunk boundaries, so latency scales
+    with the largest chunk instead of the whole document.
+
+    Args:
+        proof: Content of the LaTeX proof
+        prompt_template: Extraction prompt with a ``{proof}`` placeholder
+        system_message: System message sent with every chunk
+        max_chars: Maximum number of characters per chunk
+        **batch_kwargs: Passed to extract_triplets_batch (concurrency,
+            rate limits, retries, cache)
+
+    Returns:
+        The stitched Triplet
+    """
+    chunks = split_latex_proof(proof, max_chars)
+    prompts = [prompt_template.format(proof=chunk) for chunk in chunks]
+    triplets = await extract_triplets_batch(prompts, system_message, **batch_kwargs)
+    return stitch_triplets(triplets)
+
+
+def _complete_items(
+    partial: dict, emitted: Dict[str, int], final: bool
+) -> Iterator[Union[Entity, Relation]]:
+    """
+    Yield the entities and relations of a partially parsed Triplet that are
+    complete and not yet emitted. The last element of a list is only complete
+    once a later key has started or the stream has ended.
+    """
+    keys = list(partial)
+    for key, model in (("entities", Entity), ("relations", Relation)):
+        items = partial.get(key) or []
+        still_growing = not final and keys and keys[-1] == key
+        complete = len(items) - 1 if still_growing else len(items)
+        for item in items[emitted[key] : complete]:
+            yield model(**item)
+        emitted[key] = max(emitted[key], complete)
+
+
+def _streaming_request(custom_prompt: str, system_message: str):
+    """Messages and structured streaming runnable for stream_triplets."""
+    messages = [
+        SystemMessage(content=system_message),
+        HumanMessage(content=custom_prompt),
+    ]
+    # A JSON schema (instead of the pydantic class) makes the output parser
+    # emit partial dicts while tokens arrive
+    structured_llm = get_chat_model().with_structured_output(
+        Triplet.model_json_schema(), method="json_schema"
     )
+    return messages, structured_llm
+
 
-    # Format the prompt into a list of BaseMessages
-    formatted_prompt = prompt.format_messages()
+def _open_stream(
+    structured_llm, messages: list, record: LLMCallRecord
+) -> Iterator[dict]:
+    """
+    Start the stream and wait for its first chunk through
+    call_with_retries_sync, so rate-limit and server errors raised when the
+    request is sent are retried and counted on ``record``. Errors after the
+    first chunk are not retried, since items may already have been yielded.
+    """
+    config = {"callbacks": [record.usage_callback()]}
 
-    print(formatted_prompt)
+    def start():
+        stream = iter(structured_llm.stream(messages, config=config))
+        return stream, next(stream, None)
+
+    stream, first = call_with_retries_sync(
+        start, OPENAI_MAX_RETRIES, on_retry=record.count_retry
+    )
+    if first is not None:
+        yield first
+    yield from stream
 
-    # Use with_structured_output to enforce the CalculationGraph schema
-    structured_llm = llm.with_structured_output(CalculationGraph)
 
-    # Invoke the LLM with the formatted prompt
-    calculation_graph = structured_llm.invoke(formatted_prompt)
+async def _aopen_stream(
+    structured_llm, messages: list, record: LLMCallRecord
+) -> AsyncIterator[dict]:
+    """Async counterpart of _open_stream."""
+    config = {"callbacks": [record.usage_callback()]}
+
+    async def start():
+        stream = structured_llm.astream(messages, config=config).__aiter__()
+        try:
+            return stream, await stream.__anext__()
+        except StopAsyncIteration:
+            return stream, None
+
+    stream, first = await call_with_retries(
+        start, OPENAI_MAX_RETRIES, on_retry=record.count_retry
+    )
+    if first is not None:
+        yield first
+    async for partial in stream:
+        yield partial
+
+
+def stream_triplets(
+    custom_prompt: str = TRIPLET_EXTRACTION_PROMPT,
+    system_message: str = TRIPLET_EXTRACTION_SYSTEM_MESSAGE,
+    use_cache: bool = True,
+) -> Iterator[Union[Entity, Relation]]:
+    """
+    Extract a Triplet while the LLM is still generating it.
+
+    Entities and relations are parsed from the token stream and yielded one
+    by one as soon as each is complete, entities first, so consumers such as
+    Neo4JUtils.store_triplet_stream can start on the first nodes before the
+    rest of the graph has been generated. The recorded latency runs until
+    the stream is exhausted and includes the consumer's time. Errors raised
+    before the first chunk arrives are retried like the other calls; a
+    stream failing midway is not.
+
+    Args:
+        custom_prompt: Formatted extraction prompt
+        system_message: System message sent with the prompt
+        use_cache: Whether to read and fill the LLM response cache
+
+    Yields:
+        Entity and Relation objects in the order the model produces them
+    """
+    cache = get_default_cache() if use_cache else None
+    cache_key = LLMResponseCache.make_key(
+        system_message,
+        custom_prompt,
+        OPENAI_LLM_MODEL,
+        OPENAI_LLM_TEMPERATURE,
+        Triplet,
+    )
+    with get_default_metrics().track("stream_triplets") as record:
+        if cache is not None:
+            cached = cache.get(cache_key, Triplet)
+            if cached is not None:
+                record.cache_hit = True
+                yield from cached.entities
+                yield from cached.relations
+                return
+
+        messages, structured_llm = _streaming_request(custom_prompt, system_message)
+        emitted = {"entities": 0, "relations": 0}
+        entities, relations = [], []
+        partial: dict = {}
+        for partial in _open_stream(structured_llm, messages, record):
+            for item in _complete_items(partial, emitted, final=False):
+                (entities if isinstance(item, Entity) else relations).append(item)
+                yield item
+        for item in _complete_items(partial, emitted, final=True):
+            (entities if isinstance(item, Entity) else relations).append(item)
+            yield item
+
+    if cache is not None:
+        cache.set(cache_key, Triplet(entities=entities, relations=relations))
+
+
+async def astream_triplets(
+    custom_prompt: str = TRIPLET_EXTRACTION_PROMPT,
+    system_message: str = TRIPLET_EXTRACTION_SYSTEM_MESSAGE,
+    use_cache: bool = True,
+) -> AsyncIterator[Union[Entity, Relation]]:
+    """Async counterpart of stream_triplets, for use inside an event loop."""
+    cache = get_default_cache() if use_cache else None
+    cache_key = LLMResponseCache.make_key(
+        system_message,
+        custom_prompt,
+        OPENAI_LLM_MODEL,
+        OPENAI_LLM_TEMPERATURE,
+        Triplet,
+    )
+    with get_default_metrics().track("astream_triplets") as record:
+        if cache is not None:
+            cached = cache.get(cache_key, Triplet)
+            if cached is not None:
+                record.cache_hit = True
+                for item in [*cached.entities, *cached.relations]:
+                    yield item
+                return
+
+        messages, structured_llm = _streaming_request(custom_prompt, system_message)
+        emitted = {"entities": 0, "relations": 0}
+        entities, relations = [], []
+        partial: dict = {}
+        async for partial in _aopen_stream(structured_llm, messages, record):
+            for item in _complete_items(partial, emitted, final=False):
+                (entities if isinstance(item, Entity) else relations).append(item)
+                yield item
+        for item in _complete_items(partial, emitted, final=True):
+            (entities if isinstance(item, Entity) else relations).append(item)
+            yield item
 
-    return calculation_graph
+    if cache is not None:
+        cache.set(cache_key, Triplet(entities=entities, relations=relations))
@@ -0,0 +1,269 @@
+# Multi-level (fine / mid / high) triplet extraction from a single pass
+import math
+from collections import Counter, defaultdict
+from typing import Dict, List, Literal, Tuple
+
+from src.phase2.serialization import (
+    serialize_entities,
+    serialize_relations,
+    shorten_ids,
+)
+from .extract_triplets import extract_structured, extract_triplets
+from .prompts import (
+    FINE_GRAINED_TRIPLET_EXTRACTION_PROMPT,
+    GRAPH_AGGREGATION_SYSTEM_MESSAGE,
+    HIGH_LEVEL_AGGREGATION_PROMPT,
+    MID_LEVEL_AGGREGATION_PROMPT,
+    TRIPLET_EXTRACTION_SYSTEM_MESSAGE,
+)
+from .schemas import (
+    Entity,
+    EntityGroup,
+    GraphAggregation,
+    Relation,
+    Triplet,
+    TripletHierarchy,
+)
+
+# Graph levels from the finest to the coarsest
+GRAPH_LEVELS = ("fine", "mid", "high")
+
+AGGREGATION_PROMPTS = {
+    "mid": MID_LEVEL_AGGREGATION_PROMPT,
+    "high": HIGH_LEVEL_AGGREGATION_PROMPT,
+}
+
+
+def _fields(**fields) -> dict:
+    """Drop None values, which the optional schema fields do not accept."""
+    return {key: value for key, value in fields.items() if value is not None}
+
+
+def project_relations(
+    triplet: Triplet, parent_of: Dict[str, str]
+) -> List[Relation]:
+    """
+    Collapse the relations of ``triplet`` onto the parent entities.
+
+    Relations inside one group are dropped; parallel relations between two
+    groups become one relation named after their most common name and type.
+    """
+    names: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+    types: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+    for relation in triplet.relations:
+        source = parent_of.get(relation.source)
+        target = parent_of.get(relation.target)
+        if source is None or target is None or source == target:
+            continue
+        names[(source, target)][relation.name] += 1
+        types[(source, target)][relation.type] += 1
+    return [
+        Relation(
+            **_fields(
+                source=source,
+                target=target,
+                name=names[(source, target)].most_common(1)[0][0],
+                type=types[(source, target)].most_common(1)[0][0],
+            )
+        )
+        for source, target in names
+    ]
+
+
+def build_level(
+    triplet: Triplet, groups: List[EntityGroup], level: str
+) -> Tuple[Triplet, Dict[str, str]]:
+    """
+    Build the coarser level of ``triplet`` from entity groups.
+
+    Groups get the ids ``{level}_{i}``. Unknown member ids are ignored, an
+    entity listed by several groups stays in the first one and entities left
+    out by every group become groups of their own, so every entity of
+    ``triplet`` has exactly one parent.
+
+    Returns:
+        The coarser Triplet and the parent id of every entity of ``triplet``
+    """
+    entities_by_id = {entity.id: entity for entity in triplet.entities}
+    parent_of: Dict[str, str] = {}
+    parents: List[Entity] = []
+
+    def add_parent(name: str, label: str, type: str, members: List[str]) -> None:
+        parent_id = f"{level}_{len(parents)}"
+        parents.append(
+            Entity(**_fields(id=parent_id, name=name, label=label, type=type))
+        )
+        for member in members:
+            parent_of[member] = parent_id
+
+    for group in groups:
+        members = [
+            member
+            for member in dict.fromkeys(group.members)
+            if member in entities_by_id and member not in parent_of
+        ]
+        if members:
+            add_parent(group.name, group.label, group.type, members)
+    for entity in triplet.entities:
+        if entity.id not in parent_of:
+            add_parent(entity.name, entity.label, entity.type, [entity.id])
+
+    coarse = Triplet(entities=parents, relations=project_relations(triplet, parent_of))
+    return coarse, parent_of
+
+
+def coarsen_triplet(
+    triplet: Triplet, max_groups: int, level: str
+) -> Tuple[Triplet, Dict[str, str]]:
+    """
+    Coarsen ``triplet`` locally, without an LLM call, by heavy-edge matching.
+
+    Each pass visits the groups from the smallest up and merges every
+    unmatched group with the unmatched neighbour it shares the most relations
+    with, roughly halving the graph, until at most ``max_groups`` groups are
+    left or no two groups are connected. A group is named after its member
+    with the most relations.
+
+    Returns:
+        The coarser Triplet and the parent id of every entity of ``triplet``
+    """
+    entities_by_id = {entity.id: entity for entity in triplet.entities}
+    edges = [
+        (relation.source, relation.target)
+        for relation in triplet.relations
+        if relation.source in entities_by_id
+        and relation.target in entities_by_id
+        and relation.source != relation.target
+    ]
+    degree = Counter(node for edge in edges for node in edge)
+    group_of = {entity_id: entity_id for entity_id in entities_by_id}
+    members: Dict[str, List[str]] = {
+        entity_id: [entity_id] for entity_id in entities_by_id
+    }
+
+    while len(members) > max_groups:
+        weights: Dict[str, Counter] = defaultdict(Counter)
+        for source, target in edges:
+            a, b = group_of[source], group_of[target]
+            if a != b:
+                weights[a][b] += 1
+                weights[b][a] += 1
+
+        matched = set()
+        for group in sorted(members, key=lambda g: len(members[g])):
+            if len(members) <= max_groups:
+                break
+            if group in matched:
+                continue
+            candidates = [
+                (weight, -len(members[neighbour]), neighbour)
+                for neighbour, weight in weights[group].items()
+                if neighbour not in matched
+            ]
+            if not candidates:
+                continue
+            neighbour = max(candidates)[2]
+            for member in members.pop(neighbour):
+                group_of[member] = group
+                members[group].append(member)
+            matched.update((group, neighbour))
+        if not matched:
+            break
+
+    groups = []
+    for group_members in members.values():
+        head = entities_by_id[max(group_members, key=lambda m: degree[m])]
+        groups.append(
+            EntityGroup(
+                **_fields(
+                    id=head.id,
+                    name=head.name,
+                    label=head.label,
+                    type="group" if len(group_members) > 1 else head.type,
+                    members=group_members,
+                )
+            )
+        )
+    return build_level(triplet, groups, level)
+
+
+def aggregate_triplet(
+    triplet: Triplet,
+    max_groups: int,
+    level: Literal["mid", "high"],
+    system_message: str = GRAPH_AGGREGATION_SYSTEM_MESSAGE,
+    use_cache: bool = True,
+) -> Tuple[Triplet, Dict[str, str]]:
+    """
+    Derive a coarser level of ``triplet`` with an LLM call over the compact
+    graph instead of the proof text. The LLM only returns the entity groups;
+    the coarser relations are projected locally.
+
+    Returns:
+        The coarser Triplet and the parent id of every entity of ``triplet``
+    """
+    compact, original_ids = shorten_ids(triplet)
+    graph = (
+        "Entities:\n"
+        + serialize_entities(compact.entities)
+        + "\n\nRelations:\n"
+        + serialize_relations(compact.relations)
+    )
+    prompt = AGGREGATION_PROMPTS[level].format(graph=graph, max_groups=max_groups)
+    aggregation = extract_structured(
+        GraphAggregation, prompt, system_message, use_cache, f"aggregate_{level}"
+    )
+    groups = [
+        group.model_copy(
+            update={"members": [original_ids.get(m, m) for m in group.members]}
+        )
+        for group in aggregation.groups
+    ]
+    return build_level(triplet, groups, level)
+
+
+def extract_hierarchical_triplets(
+    proof: str,
+    prompt_template: str = FINE_GRAINED_TRIPLET_EXTRACTION_PROMPT,
+    system_message: str = TRIPLET_EXTRACTION_SYSTEM_MESSAGE,
+    method: Literal["llm", "local"] = "llm",
+    mid_ratio: float = 0.4,
+    high_ratio: float = 0.4,
+    use_cache: bool = True,
+) -> TripletHierarchy:
+    """
+    Extract the fine, mid and high level graphs of a proof.
+
+    The proof is sent to the LLM once, for the fine-grained graph. The mid
+    level is derived from the fine graph and the high level from the mid
+    graph, either by an aggregation LLM call over the compact graph
+    (``method="llm"``) or by local coarsening (``method="local"``). Each
+    entity is linked to its parent in the next coarser level.
+
+    Args:
+        proof: Content of the LaTeX proof
+        prompt_template: Fine-grained extraction prompt with a ``{proof}``
+            placeholder
+        system_message: System message of the fine-grained extraction
+        method: How the coarser levels are derived
+        mid_ratio: Target size of the mid level relative to the fine level
+        high_ratio: Target size of the high level relative to the mid level
+        use_cache: Whether to read and fill the LLM response cache
+
+    Returns:
+        The TripletHierarchy with the levels "fine", "mid" and "high"
+    """
+    fine = extract_triplets(prompt_template.format(proof=proof), system_message, use_cache)
+    levels = {"fine": fine}
+    parents = {}
+    ratios = {"mid": mid_ratio, "high": high_ratio}
+    for finer, coarser in zip(GRAPH_LEVELS, GRAPH_LEVELS[1:]):
+        triplet = levels[finer]
+        max_groups = max(1, math.ceil(len(triplet.entities) * ratios[coarser]))
+        if method == "local":
+            levels[coarser], parents[finer] = coarsen_triplet(triplet, max_groups, coarser)
+        else:
+            levels[coarser], parents[finer] = aggregate_triplet(
+                triplet, max_groups, coarser, use_cache=use_cache
+            )
+    return TripletHierarchy(levels=levels, parents=parents)
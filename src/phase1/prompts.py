@@ -1,11 +1,15 @@
 # Customized prompts for LLM
+# Every template keeps its static instructions before the {proof} placeholder,
+# so the prompt prefix is byte-identical across proofs and can be served from
+# the provider's prompt cache.
+TRIPLET_EXTRACTION_SYSTEM_MESSAGE = "You are a helpful assistant that extracts entities and relations from mathematical proofs."
+
 TRIPLET_EXTRACTION_PROMPT = """
 Extract entities and relations from the following LaTeX proof. Return the output in JSON format.
+Entities should include axioms, lemmas, and conclusions. Relations should describe connections between them, such as "grounds" or "explains".
 
 LaTeX Proof:
 {proof}
-
-Entities should include axioms, lemmas, and conclusions. Relations should describe connections between them, such as "grounds" or "explains".
 """
 
 HIGH_LEVEL_TRIPLET_EXTRACTION_PROMPT = """
@@ -35,6 +39,30 @@ Proof:
 {proof}
 """
 
+GRAPH_AGGREGATION_SYSTEM_MESSAGE = "You are a helpful assistant that summarizes detailed proof graphs into coarser graphs."
+
+MID_LEVEL_AGGREGATION_PROMPT = """
+Group the entities of the following detailed proof graph into an intermediate-level graph.
+Each group should capture one key step of the proof; every entity id must belong to exactly one group.
+Return the groups in JSON format, each with an id, name, label, type and the ids of its member entities.
+Entities and relations are given as tab-separated rows after a header row; relations refer to entities by id.
+
+{graph}
+
+Maximum number of groups: {max_groups}
+"""
+
+HIGH_LEVEL_AGGREGATION_PROMPT = """
+Group the entities of the following proof graph into a very high-level abstract graph.
+Each group should capture one broad concept of the proof; every entity id must belong to exactly one group.
+Return the groups in JSON format, each with an id, name, label, type and the ids of its member entities.
+Entities and relations are given as tab-separated rows after a header row; relations refer to entities by id.
+
+{graph}
+
+Maximum number of groups: {max_groups}
+"""
+
 CALCULATION_GRAPH_EXTRACTION_PROMPT = """
 Extract a detailed step-by-step calculation graph from the following mathematical proof.
 For each step, identify the mathematical expression, the operation performed, and whether it's a starting or final step.
@@ -1,6 +1,6 @@
 # Pydantic schemas for structured output
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List
 
 
 class MathStep(BaseModel):
@@ -50,3 +50,30 @@ class Relation(BaseModel):
 class Triplet(BaseModel):
     entities: List[Entity]
     relations: List[Relation]
+
+
+class EntityGroup(BaseModel):
+    id: str
+    name: str
+    label: str = None
+    type: str = None
+    members: List[str] = Field(
+        ..., description="Ids of the finer-level entities grouped by this entity"
+    )
+
+
+class GraphAggregation(BaseModel):
+    groups: List[EntityGroup] = Field(
+        ..., description="Coarser-level entities, each grouping finer-level entities"
+    )
+
+
+class TripletHierarchy(BaseModel):
+    levels: Dict[str, Triplet] = Field(
+        ..., description="Triplet of every graph level, from the finest to the coarsest"
+    )
+    parents: Dict[str, Dict[str, str]] = Field(
+        ...,
+        description="For every level but the coarsest, the id of each entity's "
+        "parent entity in the next coarser level",
+    )
@@ -1,11 +1,151 @@
 # Semantic clustering of entities/relations
+from typing import List, Literal
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.cluster import AgglomerativeClustering
 
+from src.phase1.schemas import Entity
+from .embeddings import DEFAULT_EMBEDDING_COSINE_THRESHOLD, cluster_entities_embedding
+
+# Cosine distance of two L2-normalised vectors at Euclidean distance 0.5
+# (d_cos = d_euclid^2 / 2), i.e. the pairwise equivalent of the default
+# agglomerative distance threshold
+DEFAULT_COSINE_THRESHOLD = 0.125
+
+
+def cluster_entities(
+    entities: List[Entity],
+    method: Literal["agglomerative", "sparse", "embedding"] = "agglomerative",
+    distance_threshold: float = 0.5,
+    cosine_threshold: float = DEFAULT_COSINE_THRESHOLD,
+    embedding_threshold: float = DEFAULT_EMBEDDING_COSINE_THRESHOLD,
+    **kwargs,
+) -> np.ndarray:
+    """
+    Cluster entities by their label.
 
-def cluster_entities(entities):
+    Args:
+        entities: Entities to cluster
+        method: "agglomerative" clusters the dense TF-IDF matrix, which needs
+            O(n^2) memory and is meant for a single proof; "sparse" runs
+            cluster_entities_sparse and scales to the whole corpus;
+            "embedding" runs cluster_entities_embedding, which compares label
+            embeddings and scales near-linearly
+        distance_threshold: Ward linkage threshold on the Euclidean distance
+            between TF-IDF vectors, used by the "agglomerative" method
+        cosine_threshold: Maximum cosine distance between linked labels, used
+            by the "sparse" method. For two labels, a Euclidean distance d
+            corresponds to a cosine distance of d^2 / 2, so the default
+            matches the default distance_threshold of 0.5
+        embedding_threshold: Maximum cosine distance between the embeddings
+            of linked labels, used by the "embedding" method
+        **kwargs: Passed to cluster_entities_sparse or
+            cluster_entities_embedding
+
+    Returns:
+        Cluster label of every entity
+    """
+    if method == "sparse":
+        return cluster_entities_sparse(entities, cosine_threshold, **kwargs)
+    if method == "embedding":
+        return cluster_entities_embedding(entities, embedding_threshold, **kwargs)
     vectorizer = TfidfVectorizer()
     X = vectorizer.fit_transform([entity.label for entity in entities])
-    clustering = AgglomerativeClustering(n_clusters=None, distance_threshold=0.5)
+    clustering = AgglomerativeClustering(
+        n_clusters=None, distance_threshold=distance_threshold
+    )
     labels = clustering.fit_predict(X.toarray())
     return labels
+
+
+def similarity_graph(
+    X: csr_matrix,
+    cosine_threshold: float,
+    n_neighbors: int,
+    block_size: int,
+    max_block_size: int,
+) -> csr_matrix:
+    """
+    Sparse graph linking every row of the L2-normalised matrix ``X`` to its
+    ``n_neighbors`` most similar rows within ``cosine_threshold``.
+
+    Candidate pairs are generated by blocking: two rows are compared only if
+    they share a term that occurs in at most ``max_block_size`` rows, so very
+    common terms do not make the comparison quadratic. Candidates are found
+    ``block_size`` rows at a time with sparse products and then scored with
+    their exact cosine similarity.
+    """
+    n = X.shape[0]
+    postings = np.diff(X.tocsc().indptr)
+    blocking = X.multiply((postings <= max_block_size).astype(X.dtype)).tocsr()
+    blocking.eliminate_zeros()
+    blocking.data[:] = 1.0
+    blocking_t = blocking.T.tocsc()
+    min_similarity = 1.0 - cosine_threshold
+    rows, cols = [], []
+    for start in range(0, n, block_size):
+        candidates = (blocking[start : start + block_size] @ blocking_t).tocoo()
+        row, col = candidates.row + start, candidates.col
+        keep = row != col
+        row, col = row[keep], col[keep]
+        sim = np.asarray(X[row].multiply(X[col]).sum(axis=1)).ravel()
+        keep = sim >= min_similarity
+        row, col, sim = row[keep], col[keep], sim[keep]
+        # Keep the n_neighbors most similar candidates of every row
+        order = np.lexsort((-sim, row))
+        row, col = row[order], col[order]
+        first = np.searchsorted(row, row)
+        top = np.arange(len(row)) - first < n_neighbors
+        rows.append(row[top])
+        cols.append(col[top])
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    return csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+
+
+def cluster_entities_sparse(
+    entities: List[Entity],
+    cosine_threshold: float = DEFAULT_COSINE_THRESHOLD,
+    n_neighbors: int = 10,
+    block_size: int = 1024,
+    max_block_size: int = 1000,
+) -> np.ndarray:
+    """
+    Cluster entities by label without densifying the TF-IDF matrix.
+
+    Identical labels are collapsed first; the distinct labels are linked to
+    their nearest neighbours within ``cosine_threshold`` and every connected
+    component of that graph becomes a cluster (single linkage over a
+    k-nearest-neighbour graph). Time and memory grow with the number of label
+    pairs sharing an uncommon term rather than with n^2.
+
+    Args:
+        entities: Entities to cluster
+        cosine_threshold: Maximum cosine distance (1 - cosine similarity)
+            between linked labels
+        n_neighbors: Maximum number of links kept per label, which bounds
+            chaining through very common terms
+        block_size: Number of labels compared against the corpus at once
+        max_block_size: Terms occurring in more distinct labels than this are
+            not used to generate candidate pairs
+
+    Returns:
+        Cluster label of every entity, in the format of cluster_entities
+    """
+    texts = [entity.label or "" for entity in entities]
+    if not texts:
+        return np.empty(0, dtype=int)
+    unique_texts, inverse = np.unique(np.array(texts, dtype=object), return_inverse=True)
+    try:
+        X = TfidfVectorizer().fit_transform(unique_texts)
+    except ValueError:
+        # Only empty or stop-word labels: each distinct label is its own cluster
+        return inverse.ravel().astype(int)
+    graph = similarity_graph(
+        X.tocsr(), cosine_threshold, n_neighbors, block_size, max_block_size
+    )
+    _, components = connected_components(graph, directed=False)
+    return components[inverse.ravel()]
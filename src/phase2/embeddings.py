@@ -0,0 +1,337 @@
+# Embedding-based entity resolution with a local approximate nearest-neighbour index
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from configs.settings import EMBEDDING_BACKEND, EMBEDDING_CACHE_PATH
+from src.phase1.schemas import Entity
+
+# Maximum cosine distance between the embeddings of two labels of one cluster
+DEFAULT_EMBEDDING_COSINE_THRESHOLD = 0.2
+
+
+class EmbeddingBackend(ABC):
+    """
+    Encodes texts into L2-normalised dense vectors. Subclasses implement
+    ``_encode_batch``; ``name`` identifies the model in the embedding cache.
+    """
+
+    name: str = "backend"
+    dimension: int = 0
+
+    def __init__(self, batch_size: int = 256) -> None:
+        self.batch_size = batch_size
+
+    @abstractmethod
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Encode one batch of texts, one row per text."""
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Encode ``texts`` ``batch_size`` at a time into a float32 matrix."""
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        batches = [
+            self._encode_batch(texts[start : start + self.batch_size])
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        vectors = np.vstack(batches).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class HashingEmbedding(EmbeddingBackend):
+    """
+    Hashing-trick vectors of character n-grams. Needs no model or fitting, so
+    vectors never change as the corpus grows; it tolerates spelling and
+    formatting variants but not synonyms.
+    """
+
+    def __init__(
+        self, dimension: int = 256, ngram_range=(2, 4), batch_size: int = 4096
+    ) -> None:
+        super().__init__(batch_size)
+        self.dimension = dimension
+        self.name = f"hashing-{dimension}-{ngram_range[0]}-{ngram_range[1]}"
+        self.vectorizer = HashingVectorizer(
+            n_features=dimension, analyzer="char_wb", ngram_range=ngram_range
+        )
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        return self.vectorizer.transform(texts).toarray()
+
+
+class SentenceTransformerEmbedding(EmbeddingBackend):
+    """
+    Local sentence-embedding model, which also matches synonyms ("Lemma 1" vs
+    "first lemma"). Requires the optional ``sentence-transformers`` package
+    and a model already present in the local model cache; nothing is
+    downloaded.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        batch_size: int = 64,
+        device: Optional[str] = None,
+    ) -> None:
+        super().__init__(batch_size)
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as error:
+            raise ImportError(
+                "SentenceTransformerEmbedding requires the sentence-transformers "
+                "package; install it or use the 'hashing' embedding backend"
+            ) from error
+        self.model = SentenceTransformer(model_name, device=device, local_files_only=True)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.name = f"sentence-transformers-{model_name}"
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False
+        )
+
+
+def get_embedding_backend(name: str = EMBEDDING_BACKEND) -> EmbeddingBackend:
+    """
+    Build the embedding backend ``name``: "hashing" for HashingEmbedding,
+    anything else is taken as a local sentence-transformers model name.
+    """
+    if name == "hashing":
+        return HashingEmbedding()
+    return SentenceTransformerEmbedding(name)
+
+
+class EmbeddingCache:
+    """
+    Persistent SQLite cache of label embeddings, keyed by backend name and
+    label text, so each distinct label is encoded once per model.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH) -> None:
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path: Path of the SQLite file
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                backend TEXT NOT NULL,
+                text TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (backend, text)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get_many(self, backend: str, texts: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Cached vectors of the ``texts`` encoded by ``backend``."""
+        found = {}
+        with self._lock:
+            # Stay below SQLite's limit on the number of bound parameters
+            for start in range(0, len(texts), 500):
+                chunk = list(texts[start : start + 500])
+                rows = self._conn.execute(
+                    "SELECT text, vector FROM embeddings WHERE backend = ? AND text IN "
+                    f"({', '.join('?' * len(chunk))})",
+                    [backend, *chunk],
+                ).fetchall()
+                for text, vector in rows:
+                    found[text] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def set_many(self, backend: str, texts: Sequence[str], vectors: np.ndarray) -> None:
+        """Store the vectors of ``texts`` encoded by ``backend``."""
+        rows = [
+            (backend, text, np.asarray(vector, dtype=np.float32).tobytes())
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (backend, text, vector) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+
+def embed_texts(
+    texts: Sequence[str],
+    backend: EmbeddingBackend,
+    cache: Optional[EmbeddingCache] = None,
+) -> np.ndarray:
+    """
+    Embed ``texts`` with ``backend``, encoding only the texts missing from
+    ``cache`` and adding them to it.
+
+    Returns:
+        One L2-normalised row per text
+    """
+    texts = list(texts)
+    if cache is None:
+        return backend.encode(texts)
+    found = cache.get_many(backend.name, texts)
+    missing = [text for text in dict.fromkeys(texts) if text not in found]
+    if missing:
+        vectors = backend.encode(missing)
+        cache.set_many(backend.name, missing, vectors)
+        found.update(zip(missing, vectors))
+    if not texts:
+        return np.empty((0, backend.dimension), dtype=np.float32)
+    return np.vstack([found[text] for text in texts])
+
+
+class LSHIndex:
+    """
+    Random-hyperplane locality-sensitive hashing of L2-normalised vectors.
+
+    Each of ``n_tables`` tables hashes a vector to the signs of its
+    projections on ``n_bits`` random hyperplanes; vectors sharing a bucket in
+    any table are candidate neighbours. Two vectors at angle theta share a
+    bucket of one table with probability (1 - theta / pi) ** n_bits, so more
+    bits make buckets smaller and more tables raise the recall.
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        n_tables: int = 16,
+        n_bits: int = 12,
+        max_bucket_size: int = 32,
+        window: int = 4,
+        seed: int = 0,
+    ) -> None:
+        """
+        Args:
+            dimension: Dimension of the indexed vectors
+            n_tables: Number of hash tables
+            n_bits: Hyperplanes per table (at most 62)
+            max_bucket_size: Buckets with more vectors than this only pair
+                vectors that are close along a random projection
+            window: Neighbours along the projection paired in such buckets
+            seed: Seed of the random hyperplanes
+        """
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((n_tables, dimension, n_bits)).astype(np.float32)
+        self.directions = rng.standard_normal((dimension, n_tables)).astype(np.float32)
+        self.max_bucket_size = max_bucket_size
+        self.window = window
+        self._powers = 1 << np.arange(n_bits, dtype=np.int64)
+
+    def hash(self, vectors: np.ndarray) -> np.ndarray:
+        """Bucket of every vector in every table, shape (n_tables, n)."""
+        n_tables, dimension, n_bits = self.planes.shape
+        projections = vectors @ self.planes.transpose(1, 0, 2).reshape(dimension, -1)
+        bits = projections.reshape(len(vectors), n_tables, n_bits) > 0
+        return (bits.astype(np.int64) @ self._powers).T
+
+    def candidate_pairs(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Distinct pairs (i, j), i < j, of rows of ``vectors`` that are
+        candidate neighbours in some table: all pairs of a bucket of at most
+        max_bucket_size rows, and for larger buckets only the pairs within
+        ``window`` positions along a random projection, so the number of
+        candidates stays linear in the number of rows.
+
+        Returns:
+            Array of shape (n_pairs, 2)
+        """
+        n = len(vectors)
+        pairs = []
+        for keys, projection in zip(self.hash(vectors), (vectors @ self.directions).T):
+            # Sort by bucket, then along the projection within each bucket
+            order = np.lexsort((projection, keys))
+            sorted_keys = keys[order]
+            starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            sizes = np.diff(np.r_[starts, n])
+            # Buckets of equal size expand to all their pairs in one step
+            for size in np.unique(sizes[(sizes > 1) & (sizes <= self.max_bucket_size)]):
+                first = starts[sizes == size]
+                i, j = np.triu_indices(size, 1)
+                pairs.append((order[first[:, None] + i], order[first[:, None] + j]))
+            bucket_size = np.repeat(sizes, sizes)
+            for offset in range(1, self.window + 1):
+                same = (sorted_keys[offset:] == sorted_keys[:-offset]) & (
+                    bucket_size[offset:] > self.max_bucket_size
+                )
+                pairs.append((order[:-offset][same], order[offset:][same]))
+        rows = np.concatenate([np.ravel(row) for row, _ in pairs]).astype(np.int64)
+        cols = np.concatenate([np.ravel(col) for _, col in pairs]).astype(np.int64)
+        # Pairs found by several tables are deduplicated on their flat index
+        flat = np.sort(np.minimum(rows, cols) * n + np.maximum(rows, cols))
+        flat = flat[np.r_[True, flat[1:] != flat[:-1]]] if len(flat) else flat
+        return np.stack(np.divmod(flat, n), 1)
+
+
+def cluster_entities_embedding(
+    entities: List[Entity],
+    cosine_threshold: float = DEFAULT_EMBEDDING_COSINE_THRESHOLD,
+    backend: Optional[EmbeddingBackend] = None,
+    cache: Optional[EmbeddingCache] = None,
+    n_tables: int = 16,
+    n_bits: int = 12,
+    max_bucket_size: int = 32,
+    window: int = 4,
+    chunk_size: int = 65536,
+) -> np.ndarray:
+    """
+    Cluster entities by the embeddings of their labels.
+
+    Identical labels are collapsed and embedded once (through ``cache`` if
+    given). Candidate pairs come from an LSHIndex and are kept when their
+    exact cosine distance is within ``cosine_threshold``; every connected
+    component of the kept pairs becomes a cluster. With bounded buckets the
+    work grows near-linearly with the number of distinct labels.
+
+    Args:
+        entities: Entities to cluster
+        cosine_threshold: Maximum cosine distance between linked labels
+        backend: Embedding backend, get_embedding_backend() by default
+        cache: Optional on-disk embedding cache
+        n_tables: LSH tables, see LSHIndex
+        n_bits: LSH hyperplanes per table, see LSHIndex
+        max_bucket_size: Largest LSH bucket expanded to all its pairs, see
+            LSHIndex
+        window: Neighbours paired in larger buckets, see LSHIndex
+        chunk_size: Candidate pairs scored at once
+
+    Returns:
+        Cluster label of every entity, in the format of cluster_entities
+    """
+    texts = [entity.label or "" for entity in entities]
+    if not texts:
+        return np.empty(0, dtype=int)
+    backend = backend or get_embedding_backend()
+    unique_texts, inverse = np.unique(np.array(texts, dtype=object), return_inverse=True)
+    vectors = embed_texts(list(unique_texts), backend, cache)
+    index = LSHIndex(vectors.shape[1], n_tables, n_bits, max_bucket_size, window)
+    pairs = index.candidate_pairs(vectors)
+    min_similarity = 1.0 - cosine_threshold
+    kept = []
+    for start in range(0, len(pairs), chunk_size):
+        chunk = pairs[start : start + chunk_size]
+        similarity = np.einsum("ij,ij->i", vectors[chunk[:, 0]], vectors[chunk[:, 1]])
+        kept.append(chunk[similarity >= min_similarity])
+    kept = np.concatenate(kept) if kept else np.empty((0, 2), dtype=np.int64)
+    n = len(unique_texts)
+    graph = csr_matrix(
+        (np.ones(len(kept), dtype=np.int8), (kept[:, 0], kept[:, 1])), shape=(n, n)
+    )
+    _, components = connected_components(graph, directed=False)
+    return components[inverse.ravel()]
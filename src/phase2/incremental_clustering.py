@@ -0,0 +1,277 @@
+# Incremental entity clustering with a persisted vocabulary and centroid index
+import json
+import math
+import os
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from configs.settings import ENTITY_INDEX_PATH
+from src.phase1.schemas import Entity
+from .clustering import DEFAULT_COSINE_THRESHOLD, cluster_entities_sparse
+
+
+class IncrementalEntityClusterer:
+    """
+    Assign entities to clusters one label at a time, without refitting.
+
+    The clusterer keeps a growing TF-IDF vocabulary with document frequencies
+    (one document per distinct label), the sum of the normalised vectors of
+    every cluster (its centroid direction) and an inverted index from terms
+    to the clusters whose centroid contains them. A new label is looked up
+    by its exact text first; otherwise a bounded set of candidate clusters
+    sharing its rarest terms is scored (see nearest_cluster), and it joins
+    the one with the most similar centroid within ``cosine_threshold`` or
+    opens a new cluster. The cost of an assignment is bounded by the
+    candidate limits, not by the number of clusters.
+
+    Centroid weights use the document frequencies at the time each label was
+    added, so they drift as the corpus grows; ``fit`` reclusters everything
+    from scratch with cluster_entities_sparse and is meant to be run
+    periodically as an offline job.
+
+    Example:
+        clusterer = IncrementalEntityClusterer.load()
+        labels = clusterer.assign(triplet.entities)
+        clusterer.save()
+    """
+
+    def __init__(
+        self,
+        cosine_threshold: float = DEFAULT_COSINE_THRESHOLD,
+        max_postings: int = 1000,
+        max_candidate_terms: int = 3,
+        max_candidates: int = 32,
+    ) -> None:
+        """
+        Args:
+            cosine_threshold: Maximum cosine distance between a label and the
+                centroid of the cluster it joins
+            max_postings: Terms occurring in more clusters than this are not
+                used to generate candidates, as in cluster_entities_sparse
+            max_candidate_terms: Terms of a label whose postings generate
+                candidates, the rarest first
+            max_candidates: Candidate clusters scored exactly per label
+        """
+        self.cosine_threshold = cosine_threshold
+        self.max_postings = max_postings
+        self.max_candidate_terms = max_candidate_terms
+        self.max_candidates = max_candidates
+        self.analyzer = TfidfVectorizer().build_analyzer()
+        self.vocabulary: Dict[str, int] = {}
+        self.document_frequency: List[int] = []
+        self.label_clusters: Dict[str, int] = {}
+        self.centroids: List[Dict[int, float]] = []
+        self.squared_norms: List[float] = []
+        # Centroid norms, grown by doubling so candidates index them at once
+        self.norms = np.zeros(0)
+        self.sizes: List[int] = []
+        # Term -> cluster -> weight of the term in the cluster's centroid sum
+        self.postings: Dict[int, Dict[int, float]] = {}
+
+    @property
+    def n_clusters(self) -> int:
+        return len(self.centroids)
+
+    def _add_document(self, label: str) -> None:
+        """Count a new distinct label in the document frequencies."""
+        for term in set(self.analyzer(label)):
+            index = self.vocabulary.setdefault(term, len(self.vocabulary))
+            if index == len(self.document_frequency):
+                self.document_frequency.append(0)
+            self.document_frequency[index] += 1
+
+    def _vector(self, label: str, n_documents: int) -> Dict[int, float]:
+        """L2-normalised TF-IDF vector of ``label`` (smoothed idf)."""
+        counts = Counter(
+            self.vocabulary[term] for term in self.analyzer(label) if term in self.vocabulary
+        )
+        vector = {
+            index: count
+            * (math.log((1 + n_documents) / (1 + self.document_frequency[index])) + 1)
+            for index, count in counts.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {index: weight / norm for index, weight in vector.items()} if norm else {}
+
+    def _new_cluster(self) -> int:
+        self.centroids.append({})
+        self.squared_norms.append(0.0)
+        self.sizes.append(0)
+        cluster = len(self.centroids) - 1
+        if cluster == len(self.norms):
+            self.norms = np.concatenate([self.norms, np.zeros(max(cluster, 16))])
+        return cluster
+
+    def _add_to_cluster(self, cluster: int, label: str, vector: Dict[int, float]) -> None:
+        centroid = self.centroids[cluster]
+        for index, weight in vector.items():
+            old = centroid.get(index, 0.0)
+            centroid[index] = old + weight
+            self.squared_norms[cluster] += 2 * old * weight + weight * weight
+            self.postings.setdefault(index, {})[cluster] = old + weight
+        self.norms[cluster] = math.sqrt(self.squared_norms[cluster])
+        self.sizes[cluster] += 1
+        self.label_clusters[label] = cluster
+
+    def nearest_cluster(self, vector: Dict[int, float]) -> Optional[int]:
+        """
+        Cluster whose centroid is the most similar to ``vector`` within
+        cosine_threshold, or None.
+
+        Candidates come from the postings of the ``max_candidate_terms``
+        highest-weighted (rarest) terms of ``vector`` that are used by at
+        most max_postings clusters, and are scored over those terms with
+        vectorised sums. Only the ``max_candidates`` best are then scored
+        exactly, so the cost of a lookup is bounded whatever the corpus size.
+        """
+        terms = sorted(vector, key=vector.get, reverse=True)
+        candidate_terms = [
+            index
+            for index in terms
+            if 0 < len(self.postings.get(index, ())) <= self.max_postings
+        ][: self.max_candidate_terms]
+        if not candidate_terms:
+            return None
+        clusters = np.concatenate(
+            [
+                np.fromiter(self.postings[index], dtype=np.int64)
+                for index in candidate_terms
+            ]
+        )
+        weights = np.concatenate(
+            [
+                vector[index]
+                * np.fromiter(self.postings[index].values(), dtype=np.float64)
+                for index in candidate_terms
+            ]
+        )
+        clusters, inverse = np.unique(clusters, return_inverse=True)
+        partial = np.bincount(inverse, weights=weights)
+        norms = self.norms[clusters]
+        if len(clusters) > self.max_candidates:
+            top = np.argpartition(partial / norms, -self.max_candidates)
+            top = top[-self.max_candidates :]
+            clusters, partial, norms = clusters[top], partial[top], norms[top]
+        for index in terms:
+            if index in candidate_terms:
+                continue
+            postings = self.postings.get(index, {})
+            partial += vector[index] * np.array(
+                [postings.get(cluster, 0.0) for cluster in clusters.tolist()]
+            )
+        similarity = partial / norms
+        best = int(np.argmax(similarity))
+        if similarity[best] < 1.0 - self.cosine_threshold:
+            return None
+        return int(clusters[best])
+
+    def assign(self, entities: List[Entity]) -> np.ndarray:
+        """
+        Cluster ``entities`` against the existing clusters, opening new ones
+        as needed, and add them to the index. Entities are processed in
+        order, so later entities can join clusters opened by earlier ones.
+
+        Returns:
+            Cluster id of every entity; ids of existing clusters are stable
+        """
+        labels = np.empty(len(entities), dtype=int)
+        for i, entity in enumerate(entities):
+            label = entity.label or ""
+            cluster = self.label_clusters.get(label)
+            if cluster is None:
+                self._add_document(label)
+                vector = self._vector(label, len(self.label_clusters) + 1)
+                cluster = self.nearest_cluster(vector) if vector else None
+                if cluster is None:
+                    cluster = self._new_cluster()
+                self._add_to_cluster(cluster, label, vector)
+            labels[i] = cluster
+        return labels
+
+    def fit(self, entities: List[Entity], **kwargs) -> np.ndarray:
+        """
+        Recluster ``entities`` from scratch with cluster_entities_sparse and
+        rebuild the vocabulary and the centroid index from the result.
+
+        Args:
+            entities: The whole corpus of entities
+            **kwargs: Passed to cluster_entities_sparse
+
+        Returns:
+            Cluster id of every entity
+        """
+        clusters = cluster_entities_sparse(entities, self.cosine_threshold, **kwargs)
+        self.__init__(
+            self.cosine_threshold,
+            self.max_postings,
+            self.max_candidate_terms,
+            self.max_candidates,
+        )
+        cluster_of: Dict[str, int] = {}
+        for entity, cluster in zip(entities, clusters):
+            cluster_of.setdefault(entity.label or "", int(cluster))
+        for label in cluster_of:
+            self._add_document(label)
+        # Use the final document frequencies for every label
+        n_documents = len(cluster_of)
+        for cluster in range(int(clusters.max()) + 1 if len(clusters) else 0):
+            self._new_cluster()
+        for label, cluster in cluster_of.items():
+            self._add_to_cluster(cluster, label, self._vector(label, n_documents))
+        return clusters
+
+    def save(self, path: str = ENTITY_INDEX_PATH) -> None:
+        """Write the clusterer state as JSON; postings are rebuilt on load."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        state = {
+            "cosine_threshold": self.cosine_threshold,
+            "max_postings": self.max_postings,
+            "max_candidate_terms": self.max_candidate_terms,
+            "max_candidates": self.max_candidates,
+            "vocabulary": self.vocabulary,
+            "document_frequency": self.document_frequency,
+            "label_clusters": self.label_clusters,
+            "centroids": [list(centroid.items()) for centroid in self.centroids],
+            "sizes": self.sizes,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = ENTITY_INDEX_PATH, **kwargs) -> "IncrementalEntityClusterer":
+        """
+        Load a clusterer saved with ``save``, or return an empty one if
+        ``path`` does not exist.
+
+        Args:
+            path: JSON file written by ``save``
+            **kwargs: Constructor arguments of an empty clusterer
+        """
+        if not os.path.exists(path):
+            return cls(**kwargs)
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        clusterer = cls(
+            state["cosine_threshold"],
+            state["max_postings"],
+            state["max_candidate_terms"],
+            state["max_candidates"],
+        )
+        clusterer.vocabulary = state["vocabulary"]
+        clusterer.document_frequency = state["document_frequency"]
+        clusterer.label_clusters = state["label_clusters"]
+        clusterer.sizes = state["sizes"]
+        for cluster, items in enumerate(state["centroids"]):
+            centroid = {int(index): weight for index, weight in items}
+            clusterer.centroids.append(centroid)
+            squared_norm = sum(weight * weight for weight in centroid.values())
+            clusterer.squared_norms.append(squared_norm)
+            for index, weight in centroid.items():
+                clusterer.postings.setdefault(index, {})[cluster] = weight
+        clusterer.norms = np.sqrt(np.array(clusterer.squared_norms, dtype=float))
+        return clusterer
@@ -1,12 +1,32 @@
 # Customized prompts for LLM
+# Static instructions come first so the prefix is identical across calls and
+# can be served from the provider's prompt cache; the graph comes last.
+RESOLUTION_SYSTEM_MESSAGE = (
+    "You are a helpful assistant that resolves entities and relations into a DAG."
+)
+
 RESOLUTION_PROMPT = """
 Resolve the following entities and relations into a directed acyclic graph (DAG).
+Entities and relations are given as tab-separated rows after a header row; relations refer to entities by id.
+Return the resolved graph in JSON format with "entities" (id, name, label, type) and "relations" (source, target, name, type).
 
 Entities:
 {entities}
 
 Relations:
 {relations}
+"""
+
+ENTITY_MERGE_SYSTEM_MESSAGE = (
+    "You are a helpful assistant that identifies duplicate entities in a knowledge graph."
+)
 
-Return the resolved graph in JSON format.
+ENTITY_MERGE_PROMPT = """
+The following entities were extracted from the same proof and have similar labels.
+Group the entities that refer to the same mathematical object, statement or step; an entity that is distinct from all the others forms a group of its own.
+Entities are given as tab-separated rows after a header row.
+Return JSON with "groups"; each group has the "id", "name", "label" and "type" of the merged entity and "members", the ids of the entities it merges.
+
+Entities:
+{entities}
 """
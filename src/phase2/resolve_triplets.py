@@ -1,25 +1,194 @@
 # Main script for triplet resolution
-from langchain.chat_models import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage
-from .schemas import Triplet
+import asyncio
+import logging
+import re
+from typing import Dict, List, Literal, Tuple
+
+from src.phase1.extract_triplets import extract_structured_batch
+from src.phase1.schemas import Entity, GraphAggregation, Triplet
 from .clustering import cluster_entities
-import json
-
-
-def resolve_triplets(triplet: Triplet) -> Triplet:
-    # Cluster entities
-    labels = cluster_entities(triplet.entities)
-    # Resolve using LLM
-    llm = ChatOpenAI(model="gpt-4")
-    messages = [
-        SystemMessage(
-            content="You are a helpful assistant that resolves entities and relations into a DAG."
-        ),
-        HumanMessage(
-            content=RESOLUTION_PROMPT.format(
-                entities=triplet.entities, relations=triplet.relations
+from .prompts import ENTITY_MERGE_PROMPT, ENTITY_MERGE_SYSTEM_MESSAGE
+from .serialization import serialize_entities
+from .validation import validate_triplet
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+
+
+def _normalize(value: str) -> str:
+    """Lowercase ``value`` and drop math delimiters, punctuation and extra spaces."""
+    return " ".join(_PUNCTUATION_PATTERN.sub(" ", (value or "").lower()).split())
+
+
+def _merge_key(entity: Entity) -> Tuple[str, str]:
+    """Entities of a cluster with the same key are merged without the LLM."""
+    return _normalize(entity.name), _normalize(entity.type)
+
+
+class _Merges:
+    """Union-find over entity positions; the earliest entity is the root."""
+
+    def __init__(self, n: int) -> None:
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> None:
+        i, j = self.find(i), self.find(j)
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+
+def _ambiguous_batches(
+    entities: List[Entity], labels, merges: _Merges, max_batch_size: int
+) -> List[List[int]]:
+    """
+    Merge the entities of every cluster that share a merge key, and return
+    the clusters that still hold several distinct entities, as batches of
+    at most ``max_batch_size`` representatives.
+    """
+    clusters: Dict[int, List[int]] = {}
+    for i, label in enumerate(labels):
+        clusters.setdefault(int(label), []).append(i)
+    batches = []
+    for members in clusters.values():
+        representatives: Dict[Tuple[str, str], int] = {}
+        for i in members:
+            key = _merge_key(entities[i])
+            if key in representatives:
+                merges.union(representatives[key], i)
+            else:
+                representatives[key] = i
+        candidates = list(representatives.values())
+        if len(candidates) < 2:
+            continue
+        for start in range(0, len(candidates), max_batch_size):
+            batch = candidates[start : start + max_batch_size]
+            if len(batch) > 1:
+                batches.append(batch)
+    return batches
+
+
+def _rebuild(triplet: Triplet, merges: _Merges) -> Triplet:
+    """
+    Keep the root entity of every merge and point relations at it, dropping
+    the self-loops and duplicate relations that merging creates.
+    """
+    entities = triplet.entities
+    canonical = {
+        entity.id: entities[merges.find(i)].id for i, entity in enumerate(entities)
+    }
+    relations = []
+    seen = set()
+    for relation in triplet.relations:
+        source = canonical.get(relation.source, relation.source)
+        target = canonical.get(relation.target, relation.target)
+        key = (source, target, relation.name)
+        if source == target or key in seen:
+            continue
+        seen.add(key)
+        relations.append(
+            relation.model_copy(update={"source": source, "target": target})
+        )
+    return Triplet(
+        entities=[entity for i, entity in enumerate(entities) if merges.find(i) == i],
+        relations=relations,
+    )
+
+
+async def aresolve_triplets(
+    triplet: Triplet,
+    cluster_method: Literal["agglomerative", "sparse", "embedding"] = "sparse",
+    max_batch_size: int = 20,
+    reduce: bool = True,
+    use_cache: bool = True,
+    **batch_kwargs,
+) -> Triplet:
+    """
+    Merge the entities of ``triplet`` that refer to the same object.
+
+    Entities are clustered by label. Within a cluster, entities with the
+    same normalised name and type are merged locally; the clusters that
+    still hold several distinct entities are sent to the LLM as small
+    batches, concurrently, and the groups it returns are merged too. The
+    graph is then rebuilt on the ids of the remaining entities and repaired
+    into a DAG by validate_triplet. A batch whose request fails is logged
+    and left unmerged.
+
+    Args:
+        triplet: Triplet to resolve
+        cluster_method: Passed to cluster_entities as ``method``
+        max_batch_size: Maximum number of entities per LLM request
+        reduce: Whether to drop the relations implied by a longer path
+        use_cache: Whether to use the LLM response cache
+        **batch_kwargs: Passed to extract_structured_batch (concurrency,
+            rate limits, retries)
+
+    Returns:
+        The Triplet with merged entities and remapped relations, entities
+        in topological order
+    """
+    entities = triplet.entities
+    merges = _Merges(len(entities))
+    if len(entities) > 1:
+        labels = cluster_entities(entities, method=cluster_method)
+        batches = _ambiguous_batches(entities, labels, merges, max_batch_size)
+    else:
+        batches = []
+    prompts = [
+        ENTITY_MERGE_PROMPT.format(
+            entities=serialize_entities(
+                [
+                    entities[i].model_copy(update={"id": str(short)})
+                    for short, i in enumerate(batch)
+                ]
             )
-        ),
+        )
+        for batch in batches
     ]
-    response = llm(messages)
-    return Triplet(**json.loads(response.content))
+    results = await extract_structured_batch(
+        GraphAggregation,
+        prompts,
+        ENTITY_MERGE_SYSTEM_MESSAGE,
+        use_cache=use_cache,
+        return_exceptions=True,
+        call="resolve_triplets",
+        **batch_kwargs,
+    )
+    for batch, result in zip(batches, results):
+        if isinstance(result, BaseException):
+            logger.warning("Leaving %d entities unmerged: %s", len(batch), result)
+            continue
+        for group in result.groups:
+            members = [
+                batch[int(short)]
+                for short in group.members
+                if short.isdigit() and int(short) < len(batch)
+            ]
+            for i in members[1:]:
+                merges.union(members[0], i)
+    resolved, report = validate_triplet(_rebuild(triplet, merges), reduce=reduce)
+    if not report.is_dag:
+        logger.warning(
+            "Repaired resolved graph: dropped %d duplicate entities, %d dangling "
+            "and %d cycle relations",
+            len(report.duplicate_entities),
+            len(report.dangling_relations),
+            len(report.cycle_relations),
+        )
+    return resolved
+
+
+def resolve_triplets(triplet: Triplet, **kwargs) -> Triplet:
+    """
+    Synchronous wrapper of aresolve_triplets; takes the same arguments.
+
+    Use aresolve_triplets directly where an event loop is already running,
+    e.g. in notebooks.
+    """
+    return asyncio.run(aresolve_triplets(triplet, **kwargs))
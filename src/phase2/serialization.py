@@ -0,0 +1,75 @@
+# Compact serialization of triplets for resolution prompts
+from typing import Dict, List, Optional, Tuple
+
+from src.phase1.schemas import Entity, Relation, Triplet
+
+
+def _cell(value: Optional[str]) -> str:
+    """Render a value as a single TSV cell."""
+    if value is None:
+        return ""
+    return " ".join(str(value).split())
+
+
+def shorten_ids(triplet: Triplet) -> Tuple[Triplet, Dict[str, str]]:
+    """
+    Replace entity ids with their position in the entity list, which is
+    usually far shorter than the extracted ids.
+
+    Returns:
+        The Triplet with short ids and the mapping from short to original ids
+    """
+    short_ids = {entity.id: str(i) for i, entity in enumerate(triplet.entities)}
+    entities = [
+        entity.model_copy(update={"id": short_ids[entity.id]})
+        for entity in triplet.entities
+    ]
+    relations = [
+        relation.model_copy(
+            update={
+                "source": short_ids.get(relation.source, relation.source),
+                "target": short_ids.get(relation.target, relation.target),
+            }
+        )
+        for relation in triplet.relations
+    ]
+    original_ids = {short: original for original, short in short_ids.items()}
+    return Triplet(entities=entities, relations=relations), original_ids
+
+
+def restore_ids(triplet: Triplet, original_ids: Dict[str, str]) -> Triplet:
+    """Map short ids back to the original ids; unknown ids are kept as is."""
+    entities = [
+        entity.model_copy(update={"id": original_ids.get(entity.id, entity.id)})
+        for entity in triplet.entities
+    ]
+    relations = [
+        relation.model_copy(
+            update={
+                "source": original_ids.get(relation.source, relation.source),
+                "target": original_ids.get(relation.target, relation.target),
+            }
+        )
+        for relation in triplet.relations
+    ]
+    return Triplet(entities=entities, relations=relations)
+
+
+def serialize_entities(entities: List[Entity]) -> str:
+    """Serialize entities as TSV rows (id, name, label, type) after a header."""
+    rows = ["id\tname\tlabel\ttype"]
+    rows.extend(
+        "\t".join(_cell(value) for value in (e.id, e.name, e.label, e.type))
+        for e in entities
+    )
+    return "\n".join(rows)
+
+
+def serialize_relations(relations: List[Relation]) -> str:
+    """Serialize relations as TSV rows (source, target, name, type) after a header."""
+    rows = ["source\ttarget\tname\ttype"]
+    rows.extend(
+        "\t".join(_cell(value) for value in (r.source, r.target, r.name, r.type))
+        for r in relations
+    )
+    return "\n".join(rows)
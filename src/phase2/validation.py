@@ -0,0 +1,182 @@
+# Local validation and repair of resolved triplets as DAGs
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import groupby
+from typing import Dict, List, Tuple
+
+from src.phase1.schemas import Entity, Relation, Triplet
+
+
+@dataclass
+class GraphReport:
+    """Issues found by validate_triplet; every listed item was repaired."""
+
+    duplicate_entities: List[Entity] = field(default_factory=list)
+    dangling_relations: List[Relation] = field(default_factory=list)
+    cycle_relations: List[Relation] = field(default_factory=list)
+    redundant_relations: List[Relation] = field(default_factory=list)
+
+    @property
+    def is_dag(self) -> bool:
+        """Whether the input was a DAG with unique ids and no dangling references."""
+        return not (
+            self.duplicate_entities or self.dangling_relations or self.cycle_relations
+        )
+
+
+def _adjacency(ids: List[str], relations: List[Relation]) -> Dict[str, List[int]]:
+    """Indices of the relations leaving every entity, in relation order."""
+    successors: Dict[str, List[int]] = {entity_id: [] for entity_id in ids}
+    for i, relation in enumerate(relations):
+        successors[relation.source].append(i)
+    return successors
+
+
+def find_cycle_relations(ids: List[str], relations: List[Relation]) -> List[int]:
+    """
+    Indices of the back edges of a depth-first search, self-loops included.
+    Removing them leaves a DAG. Runs in O(V + E) with an explicit stack, so
+    deep graphs do not hit the recursion limit.
+
+    Args:
+        ids: Entity ids, in the order the search starts from them
+        relations: Relations between those ids
+    """
+    successors = _adjacency(ids, relations)
+    # 0: unvisited, 1: on the stack, 2: done
+    state = dict.fromkeys(ids, 0)
+    back_edges = []
+    for root in ids:
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, edges = stack[-1]
+            for i in edges:
+                target = relations[i].target
+                if state[target] == 1:
+                    back_edges.append(i)
+                elif state[target] == 0:
+                    state[target] = 1
+                    stack.append((target, iter(successors[target])))
+                    break
+            else:
+                state[node] = 2
+                stack.pop()
+    return sorted(back_edges)
+
+
+def topological_order(ids: List[str], relations: List[Relation]) -> List[str]:
+    """
+    Order ``ids`` so that every relation goes from an earlier to a later id
+    (Kahn's algorithm, O(V + E)). Entities are released in the order of
+    ``ids`` as their predecessors are placed.
+
+    Raises:
+        ValueError: If the relations contain a cycle
+    """
+    successors = _adjacency(ids, relations)
+    in_degree = dict.fromkeys(ids, 0)
+    for relation in relations:
+        in_degree[relation.target] += 1
+    ready = deque(entity_id for entity_id in ids if not in_degree[entity_id])
+    order = []
+    while ready:
+        node = ready.popleft()
+        order.append(node)
+        for i in successors[node]:
+            target = relations[i].target
+            in_degree[target] -= 1
+            if not in_degree[target]:
+                ready.append(target)
+    if len(order) < len(ids):
+        raise ValueError(
+            f"Relations contain a cycle through {len(ids) - len(order)} entities"
+        )
+    return order
+
+
+def find_redundant_relations(order: List[str], relations: List[Relation]) -> List[int]:
+    """
+    Indices of the relations implied by a longer path, i.e. the edges
+    removed by the transitive reduction of the DAG. Parallel relations
+    between the same two entities are kept or removed together.
+
+    Reachability sets are Python integers used as bitsets over topological
+    positions, so the cost is O(V + E) set operations on V-bit words.
+
+    Args:
+        order: Topological order of the entity ids, see topological_order
+        relations: Acyclic relations between those ids
+    """
+    position = {entity_id: i for i, entity_id in enumerate(order)}
+    successors = _adjacency(order, relations)
+    reachable = [0] * len(order)
+    redundant = []
+    for node in reversed(order):
+        # A target reachable through another successor comes after it in the
+        # topological order, so successors are visited by position
+        edges = sorted(successors[node], key=lambda i: position[relations[i].target])
+        reach = 0
+        for target, group in groupby(edges, key=lambda i: position[relations[i].target]):
+            if reach >> target & 1:
+                redundant.extend(group)
+            else:
+                reach |= reachable[target] | 1 << target
+        reachable[position[node]] = reach
+    return sorted(redundant)
+
+
+def validate_triplet(
+    triplet: Triplet, reduce: bool = True
+) -> Tuple[Triplet, GraphReport]:
+    """
+    Check that ``triplet`` is a DAG and repair it without another LLM call.
+
+    Entities with a repeated id are dropped (the first is kept), relations
+    with an unknown source or target are dropped, the relations closing a
+    cycle are dropped (the back edges of a depth-first search in entity
+    order) and, if ``reduce``, the relations implied by a longer path are
+    dropped too. Entities are returned in topological order.
+
+    Args:
+        triplet: Triplet to validate
+        reduce: Whether to apply the transitive reduction
+
+    Returns:
+        The repaired Triplet and the report of what was repaired
+    """
+    report = GraphReport()
+    entities = []
+    seen = set()
+    for entity in triplet.entities:
+        if entity.id in seen:
+            report.duplicate_entities.append(entity)
+        else:
+            seen.add(entity.id)
+            entities.append(entity)
+    ids = [entity.id for entity in entities]
+    relations = []
+    for relation in triplet.relations:
+        if relation.source in seen and relation.target in seen:
+            relations.append(relation)
+        else:
+            report.dangling_relations.append(relation)
+
+    def drop(indices: List[int], removed: List[Relation]) -> List[Relation]:
+        dropped = set(indices)
+        removed.extend(relations[i] for i in indices)
+        return [relation for i, relation in enumerate(relations) if i not in dropped]
+
+    relations = drop(find_cycle_relations(ids, relations), report.cycle_relations)
+    order = topological_order(ids, relations)
+    if reduce:
+        relations = drop(
+            find_redundant_relations(order, relations), report.redundant_relations
+        )
+    by_id = {entity.id: entity for entity in entities}
+    return (
+        Triplet(entities=[by_id[entity_id] for entity_id in order], relations=relations),
+        report,
+    )
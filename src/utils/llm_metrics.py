@@ -0,0 +1,299 @@
+# Token, latency and cost accounting for LLM calls
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from configs.settings import OPENAI_LLM_MODEL
+
+# Proof the current LLM calls belong to; set with track_proof
+current_proof: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_proof", default=None
+)
+
+SUMMARY_FIELDS = (
+    "calls",
+    "cache_hits",
+    "retries",
+    "errors",
+    "prompt_tokens",
+    "cached_prompt_tokens",
+    "completion_tokens",
+    "latency_s",
+    "queue_s",
+    "cost_usd",
+)
+
+
+def token_cost(
+    model: str, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0
+) -> Optional[float]:
+    """
+    Cost in USD of a call, or None when the model's price is unknown. Prompt
+    tokens read from the provider's prompt cache are billed at the cached
+    rate when the model has one.
+    """
+    try:
+        from langchain_community.callbacks.openai_info import (
+            TokenType,
+            get_openai_token_cost_for_model,
+        )
+    except ImportError:
+        return None
+    try:
+        cost = get_openai_token_cost_for_model(
+            model, prompt_tokens - cached_prompt_tokens, token_type=TokenType.PROMPT
+        ) + get_openai_token_cost_for_model(
+            model, completion_tokens, token_type=TokenType.COMPLETION
+        )
+    except ValueError:
+        return None
+    try:
+        cost += get_openai_token_cost_for_model(
+            model, cached_prompt_tokens, token_type=TokenType.PROMPT_CACHED
+        )
+    except ValueError:
+        cost += get_openai_token_cost_for_model(
+            model, cached_prompt_tokens, token_type=TokenType.PROMPT
+        )
+    return cost
+
+
+@dataclass
+class LLMCallRecord:
+    """Accounting of a single LLM call (including its retries)."""
+
+    call: str
+    model: str
+    proof: Optional[str] = None
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Wall time of the call itself, excluding queue_s
+    latency_s: float = 0.0
+    # Time spent waiting for a concurrency slot or the rate-limit budget
+    queue_s: float = 0.0
+    retries: int = 0
+    cache_hit: bool = False
+    error: Optional[str] = None
+    cost_usd: Optional[float] = None
+    timestamp: float = field(default_factory=time.time)
+
+    def add_usage(
+        self, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0
+    ) -> None:
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cached_prompt_tokens += cached_prompt_tokens
+
+    def usage_callback(self) -> "UsageCallbackHandler":
+        """
+        Langchain callback adding the token usage of every completion to
+        this record; pass it as ``config={"callbacks": [...]}``.
+        """
+        return UsageCallbackHandler(self)
+
+    @contextmanager
+    def queued(self) -> Iterator[None]:
+        """Count the time spent in the block as queue wait, not latency."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.queue_s += time.perf_counter() - start
+
+    def count_retry(self, error: BaseException = None) -> None:
+        """on_retry callback for call_with_retries."""
+        self.retries += 1
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Collects the token usage reported for each completion into a record."""
+
+    def __init__(self, record: LLMCallRecord) -> None:
+        super().__init__()
+        self.record = record
+
+    def on_llm_end(self, response: LLMResult, **kwargs) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    details = usage.get("input_token_details") or {}
+                    self.record.add_usage(
+                        usage.get("input_tokens", 0),
+                        usage.get("output_tokens", 0),
+                        details.get("cache_read") or 0,
+                    )
+                    return
+        # Structured streaming responses only report the raw OpenAI usage
+        token_usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                metadata = getattr(message, "response_metadata", None) or {}
+                token_usage = metadata.get("token_usage") or token_usage
+        token_usage = token_usage or (response.llm_output or {}).get("token_usage") or {}
+        details = token_usage.get("prompt_tokens_details") or {}
+        self.record.add_usage(
+            token_usage.get("prompt_tokens") or 0,
+            token_usage.get("completion_tokens") or 0,
+            details.get("cached_tokens") or 0,
+        )
+
+
+class LLMMetrics:
+    """
+    Thread-safe collector of LLMCallRecords for one run, with per-proof and
+    per-call aggregation, JSONL export and a printable summary table.
+
+    Example:
+        metrics = get_default_metrics()
+        with track_proof("sum_of_first_n_ints/proof1"):
+            triplet = extract_triplets(prompt)
+        print(metrics.summary_table())
+        metrics.to_jsonl("llm_calls.jsonl")
+    """
+
+    def __init__(self, run_id: Optional[str] = None) -> None:
+        self.run_id = run_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.records: List[LLMCallRecord] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: LLMCallRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.records = []
+
+    @contextmanager
+    def track(
+        self, call: str, model: str = OPENAI_LLM_MODEL, proof: Optional[str] = None
+    ) -> Iterator[LLMCallRecord]:
+        """
+        Time the block as one call of ``call`` and add its record when the
+        block exits. The block fills in tokens, retries and cache hits on the
+        yielded record and wraps waits for a concurrency slot or rate budget
+        in ``record.queued()``, which are reported as queue_s instead of
+        latency; errors are recorded and re-raised. ``proof`` defaults to the
+        one set by track_proof.
+        """
+        record = LLMCallRecord(
+            call=call, model=model, proof=proof or current_proof.get()
+        )
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as error:
+            record.error = type(error).__name__
+            raise
+        finally:
+            record.latency_s = time.perf_counter() - start - record.queue_s
+            if not record.cache_hit:
+                record.cost_usd = token_cost(
+                    model,
+                    record.prompt_tokens,
+                    record.completion_tokens,
+                    record.cached_prompt_tokens,
+                )
+            self.add(record)
+
+    def summarize(self, by: str = "proof") -> Dict[str, Dict[str, float]]:
+        """
+        Aggregate the records by ``by`` ("proof", "call" or "model").
+
+        Returns:
+            Mapping from group name to the sums of SUMMARY_FIELDS
+        """
+        with self._lock:
+            records = list(self.records)
+        groups: Dict[str, Dict[str, float]] = {}
+        for record in records:
+            name = getattr(record, by) or "-"
+            group = groups.setdefault(name, dict.fromkeys(SUMMARY_FIELDS, 0))
+            group["calls"] += 1
+            group["cache_hits"] += record.cache_hit
+            group["retries"] += record.retries
+            group["errors"] += record.error is not None
+            group["prompt_tokens"] += record.prompt_tokens
+            group["cached_prompt_tokens"] += record.cached_prompt_tokens
+            group["completion_tokens"] += record.completion_tokens
+            group["latency_s"] += record.latency_s
+            group["queue_s"] += record.queue_s
+            group["cost_usd"] += record.cost_usd or 0.0
+        return groups
+
+    def totals(self) -> Dict[str, float]:
+        """Sums of SUMMARY_FIELDS over the whole run."""
+        totals = dict.fromkeys(SUMMARY_FIELDS, 0)
+        for group in self.summarize().values():
+            for key in SUMMARY_FIELDS:
+                totals[key] += group[key]
+        return totals
+
+    def summary_table(self, by: str = "proof") -> str:
+        """Fixed-width table of summarize(by), most expensive groups first."""
+        groups = self.summarize(by)
+        rows = sorted(
+            groups.items(),
+            key=lambda item: (item[1]["cost_usd"], item[1]["prompt_tokens"]),
+            reverse=True,
+        )
+        rows.append(("total", self.totals()))
+        width = max([len(by)] + [len(name) for name, _ in rows])
+        header = (
+            f"{by:<{width}} {'calls':>6} {'cached':>6} {'retries':>7} {'errors':>6} "
+            f"{'prompt':>9} {'cache_rd':>9} {'complete':>9} "
+            f"{'latency_s':>10} {'queue_s':>9} {'cost_usd':>10}"
+        )
+        lines = [f"run {self.run_id}", header, "-" * len(header)]
+        for name, group in rows:
+            lines.append(
+                f"{name:<{width}} {group['calls']:>6} {group['cache_hits']:>6} "
+                f"{group['retries']:>7} {group['errors']:>6} "
+                f"{group['prompt_tokens']:>9} {group['cached_prompt_tokens']:>9} "
+                f"{group['completion_tokens']:>9} {group['latency_s']:>10.2f} "
+                f"{group['queue_s']:>9.2f} {group['cost_usd']:>10.6f}"
+            )
+        return "\n".join(lines)
+
+    def to_jsonl(self, path: str, append: bool = True) -> None:
+        """Write one JSON object per call, tagged with the run id."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            records = list(self.records)
+        with open(path, "a" if append else "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps({"run_id": self.run_id, **asdict(record)}) + "\n")
+
+
+@contextmanager
+def track_proof(proof: str) -> Iterator[None]:
+    """Attribute the LLM calls made inside the block to ``proof``."""
+    token = current_proof.set(proof)
+    try:
+        yield
+    finally:
+        current_proof.reset(token)
+
+
+_default_metrics: Optional[LLMMetrics] = None
+
+
+def get_default_metrics() -> LLMMetrics:
+    """Return the process-wide metrics collector of the current run."""
+    global _default_metrics
+    if _default_metrics is None:
+        _default_metrics = LLMMetrics()
+    return _default_metrics
@@ -1 +1,362 @@
 # Helper functions for LLM calls
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Optional, Type, TypeVar
+
+import openai
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
+
+from configs.settings import (
+    LLM_CACHE_MAX_BYTES,
+    LLM_CACHE_PATH,
+    OPENAI_API_BASE,
+    OPENAI_API_KEY,
+    OPENAI_LLM_MODEL,
+    OPENAI_LLM_TEMPERATURE,
+    OPENAI_MAX_RETRIES,
+)
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+ResultT = TypeVar("ResultT")
+
+# HTTP status codes worth retrying besides 5xx
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class LLMResponseCache:
+    """
+    Persistent SQLite cache of structured LLM responses.
+
+    Entries are keyed on a hash of everything that determines the response
+    (system message, prompt, model name, temperature and output schema) and
+    store the parsed pydantic object as JSON, so a hit returns the Triplet or
+    CalculationGraph without any network call. When the stored payloads grow
+    beyond ``max_size_bytes`` the least recently used entries are evicted.
+    """
+
+    def __init__(
+        self, path: str = LLM_CACHE_PATH, max_size_bytes: int = LLM_CACHE_MAX_BYTES
+    ) -> None:
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path: Path of the SQLite file
+            max_size_bytes: Maximum total size of the cached payloads
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(
+        system_message: str,
+        prompt: str,
+        model: str,
+        temperature: float,
+        schema: Type[BaseModel],
+    ) -> str:
+        """Hash the inputs that determine a structured LLM response."""
+        payload = json.dumps(
+            {
+                "system_message": system_message,
+                "prompt": prompt,
+                "model": model,
+                "temperature": temperature,
+                "schema": schema.model_json_schema(),
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, schema: Type[ModelT]) -> Optional[ModelT]:
+        """Return the cached response for ``key`` parsed as ``schema``, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self._conn.commit()
+            self.hits += 1
+        return schema.model_validate_json(row[0])
+
+    def set(self, key: str, response: BaseModel) -> None:
+        """Store a parsed response and evict old entries beyond the size limit."""
+        # Unset optional fields (e.g. Entity.label = None) are left out so
+        # they fall back to their defaults when validated again
+        value = response.model_dump_json(exclude_none=True)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the size limit holds."""
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_size_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access"
+        ).fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_size_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this instance and the current cache size."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+    def clear(self) -> None:
+        """Delete every cached response."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        """Close the cache database."""
+        self._conn.close()
+
+
+_default_cache: Optional[LLMResponseCache] = None
+
+
+def get_default_cache() -> LLMResponseCache:
+    """Return the process-wide cache stored at LLM_CACHE_PATH."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LLMResponseCache()
+    return _default_cache
+
+
+_chat_models: dict = {}
+
+
+def get_chat_model(
+    model_name: str = OPENAI_LLM_MODEL,
+    temperature: float = OPENAI_LLM_TEMPERATURE,
+    base_url: Optional[str] = OPENAI_API_BASE,
+    max_retries: int = 0,
+) -> ChatOpenAI:
+    """
+    Return a ChatOpenAI client shared by every call with the same settings.
+
+    The client's own retries are disabled by default; batch callers retry
+    through call_with_retries so the backoff also covers the rate limiter.
+    """
+    key = (model_name, temperature, base_url, max_retries)
+    if key not in _chat_models:
+        _chat_models[key] = ChatOpenAI(
+            model_name=model_name,
+            temperature=temperature,
+            openai_api_key=OPENAI_API_KEY,
+            openai_api_base=base_url,
+            max_retries=max_retries,
+            # Report token usage for streamed responses as well
+            stream_usage=True,
+        )
+    return _chat_models[key]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of ``text`` (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+@functools.lru_cache(maxsize=None)
+def _token_encoding(model_name: str):
+    """tiktoken encoding for ``model_name``, or None when it is unavailable."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # The BPE files are downloaded on first use; work offline as well
+        return None
+
+
+def count_tokens(text: str, model_name: str = OPENAI_LLM_MODEL) -> int:
+    """
+    Exact token count of ``text`` for ``model_name`` when tiktoken and its
+    encoding files are available, otherwise the estimate_tokens approximation.
+    """
+    encoding = _token_encoding(model_name)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text))
+
+
+class RateLimiter:
+    """
+    Async token-bucket limiter enforcing requests-per-minute and
+    tokens-per-minute budgets. Both buckets start full and refill
+    continuously at budget / 60 per second.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int) -> None:
+        """
+        Args:
+            requests_per_minute: Maximum number of requests per minute
+            tokens_per_minute: Maximum number of (estimated) tokens per minute
+        """
+        if requests_per_minute < 1 or tokens_per_minute < 1:
+            raise ValueError("Rate limits must be positive integers.")
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(
+            self.requests_per_minute,
+            self._requests + elapsed * self.requests_per_minute / 60,
+        )
+        self._tokens = min(
+            self.tokens_per_minute,
+            self._tokens + elapsed * self.tokens_per_minute / 60,
+        )
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait until one request and ``tokens`` tokens fit in the budgets."""
+        # A single request larger than the whole budget is let through once
+        # the bucket is full rather than blocking forever
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self._requests) * 60 / self.requests_per_minute,
+                    (tokens - self._tokens) * 60 / self.tokens_per_minute,
+                )
+                await asyncio.sleep(wait)
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Whether an OpenAI error is transient (rate limit, timeout, 5xx)."""
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return (
+            error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+        )
+    return False
+
+
+def _backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Full-jitter delay before retry number ``attempt`` (starting at 0)."""
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+async def call_with_retries(
+    func: Callable[[], Awaitable[ResultT]],
+    max_retries: int = OPENAI_MAX_RETRIES,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    on_retry: Optional[Callable[[BaseException], None]] = None,
+) -> ResultT:
+    """
+    Await ``func()`` and retry transient errors with full-jitter exponential
+    backoff: the n-th retry sleeps a random time in [0, base_delay * 2**n],
+    capped at ``max_delay``. ``on_retry`` is called with the error before
+    every retry.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await func()
+        except Exception as error:
+            if attempt >= max_retries or not is_retryable_error(error):
+                raise
+            if on_retry is not None:
+                on_retry(error)
+            delay = _backoff_delay(attempt, base_delay, max_delay)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+def call_with_retries_sync(
+    func: Callable[[], ResultT],
+    max_retries: int = OPENAI_MAX_RETRIES,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    on_retry: Optional[Callable[[BaseException], None]] = None,
+) -> ResultT:
+    """Blocking counterpart of call_with_retries."""
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as error:
+            if attempt >= max_retries or not is_retryable_error(error):
+                raise
+            if on_retry is not None:
+                on_retry(error)
+            delay = _backoff_delay(attempt, base_delay, max_delay)
+            attempt += 1
+            time.sleep(delay)
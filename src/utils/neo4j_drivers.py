@@ -0,0 +1,126 @@
+# Process-wide registry of Neo4j drivers shared by the Neo4JUtils classes
+import atexit
+import threading
+import warnings
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from neo4j import Driver, GraphDatabase
+
+from configs.settings import (
+    NEO4J_CONNECTION_ACQUISITION_TIMEOUT,
+    NEO4J_LIVENESS_CHECK_TIMEOUT,
+    NEO4J_MAX_CONNECTION_POOL_SIZE,
+)
+
+_drivers: Dict[Tuple[str, Tuple[str, str]], Driver] = {}
+# Pool settings each registered driver was created with
+_driver_configs: Dict[Tuple[str, Tuple[str, str]], dict] = {}
+# Schema setup already run on a shared driver, as (id(driver), name) pairs
+_provisioned: Set[Tuple[int, str]] = set()
+_lock = threading.Lock()
+
+
+def get_driver(
+    uri: str,
+    auth: Tuple[str, str],
+    max_connection_pool_size: int = NEO4J_MAX_CONNECTION_POOL_SIZE,
+    connection_acquisition_timeout: float = NEO4J_CONNECTION_ACQUISITION_TIMEOUT,
+    liveness_check_timeout: Optional[float] = NEO4J_LIVENESS_CHECK_TIMEOUT,
+) -> Driver:
+    """
+    Return the shared driver for ``uri`` and ``auth``, creating it on first use.
+
+    Every caller asking for the same URI and credentials gets the same driver
+    and therefore the same connection pool, so handshakes are paid once per
+    process instead of once per Neo4JUtils instance. The pool settings only
+    apply when the driver is created; asking for an existing driver with
+    different settings emits a RuntimeWarning and returns the existing
+    driver unchanged (call close_driver first to recreate it).
+
+    Args:
+        uri: Neo4j connection URI (e.g., "bolt://localhost:7687")
+        auth: Tuple of (username, password)
+        max_connection_pool_size: Maximum number of pooled connections
+        connection_acquisition_timeout: Seconds to wait for a free connection
+        liveness_check_timeout: Idle seconds after which a pooled connection is
+            checked before reuse; None disables the check
+
+    Returns:
+        The shared neo4j Driver
+    """
+    key = (uri, tuple(auth))
+    config = {
+        "max_connection_pool_size": max_connection_pool_size,
+        "connection_acquisition_timeout": connection_acquisition_timeout,
+        "liveness_check_timeout": liveness_check_timeout,
+    }
+    with _lock:
+        driver = _drivers.get(key)
+        if driver is None:
+            driver = GraphDatabase.driver(uri, auth=auth, **config)
+            _drivers[key] = driver
+            _driver_configs[key] = config
+        elif _driver_configs[key] != config:
+            differences = ", ".join(
+                f"{name}={config[name]!r} (driver has {value!r})"
+                for name, value in _driver_configs[key].items()
+                if config[name] != value
+            )
+            warnings.warn(
+                f"Reusing the existing Neo4j driver for {uri}; ignoring "
+                f"{differences}. Call close_driver first to apply new pool settings.",
+                RuntimeWarning,
+                stacklevel=2,
+            )
+        return driver
+
+
+def provision_once(driver: Driver, name: str, provision: Callable[[], None]) -> bool:
+    """
+    Run ``provision`` (e.g. index creation) the first time ``name`` is
+    requested for ``driver``, so instances sharing a driver do not repeat
+    the schema round trips. A failed ``provision`` is retried on the next
+    request.
+
+    Returns:
+        Whether ``provision`` ran
+    """
+    key = (id(driver), name)
+    with _lock:
+        if key in _provisioned:
+            return False
+    provision()
+    with _lock:
+        _provisioned.add(key)
+    return True
+
+
+def close_driver(uri: str, auth: Tuple[str, str]) -> None:
+    """Close and forget the shared driver for ``uri`` and ``auth``, if any."""
+    with _lock:
+        driver = _drivers.pop((uri, tuple(auth)), None)
+        _driver_configs.pop((uri, tuple(auth)), None)
+        if driver is not None:
+            _forget_provisioning(driver)
+    if driver is not None:
+        driver.close()
+
+
+def _forget_provisioning(driver: Driver) -> None:
+    """Drop the provisioning records of a closed driver (call under _lock)."""
+    for key in [key for key in _provisioned if key[0] == id(driver)]:
+        _provisioned.discard(key)
+
+
+def close_all_drivers() -> None:
+    """Close every shared driver. Registered to run at interpreter exit."""
+    with _lock:
+        drivers = list(_drivers.values())
+        _drivers.clear()
+        _driver_configs.clear()
+        _provisioned.clear()
+    for driver in drivers:
+        driver.close()
+
+
+atexit.register(close_all_drivers)
@@ -1,16 +1,485 @@
-from neo4j import GraphDatabase
-from typing import Optional, Literal
-from src.phase1.schemas import CalculationGraph, Entity, Relation, Triplet
+import hashlib
+import json
+from collections import defaultdict
+from neo4j import AsyncGraphDatabase
+from typing import Dict, Iterable, Iterator, List, Literal, Optional, Tuple, Union
+from src.utils.neo4j_drivers import get_driver, provision_once
+from src.phase1.schemas import (
+    CalculationGraph,
+    Entity,
+    MathStep,
+    MathTransition,
+    Relation,
+    Triplet,
+    TripletHierarchy,
+)
 
+# Default number of rows sent per UNWIND statement in bulk mode
+DEFAULT_BATCH_SIZE = 1000
 
-class Neo4JUtils:
-    def __init__(self, uri: str, auth: tuple[str, str]) -> None:
-        self.driver = GraphDatabase.driver(uri, auth=auth)
+# Default number of nodes removed per transaction by clean_database
+DEFAULT_DELETE_BATCH_SIZE = 10000
+
+# Display colors of start and end nodes, stored as the node's color property
+START_NODE_COLOR = "#00ff00"
+END_NODE_COLOR = "#ff0000"
+
+# Label shared by every node written by Neo4JUtils, so that id lookups can be
+# label-qualified and served by the indexes below instead of full node scans
+NODE_LABEL = "GraphNode"
+
+# Node properties that get a range index on NODE_LABEL
+INDEXED_PROPERTIES = ("id", "graph_type", "graph_level", "step", "problem")
+
+# Relationship type linking an entity to its parent in the next coarser level
+# of a TripletHierarchy
+HIERARCHY_RELATION = "PART_OF"
+
+# Node rows grouped by label and relationship rows grouped by type
+GroupedRows = Tuple[Dict[str, List[dict]], Dict[str, List[dict]]]
+
+
+def _batched(rows: List[dict], batch_size: int) -> Iterator[List[dict]]:
+    """Yield successive slices of ``rows`` holding at most ``batch_size`` items."""
+    for i in range(0, len(rows), batch_size):
+        yield rows[i : i + batch_size]
+
+
+class Neo4JQueryBuilder:
+    """
+    Cypher query and parameter building shared by Neo4JUtils and
+    AsyncNeo4JUtils. Methods here never touch a driver; they only return
+    query texts or (query, parameters) statements for the callers to run.
+    """
+
+    @staticmethod
+    def _index_queries() -> List[str]:
+        """Schema queries creating one range index per indexed node property."""
+        return [
+            f"CREATE INDEX {NODE_LABEL.lower()}_{prop} IF NOT EXISTS "
+            f"FOR (n:{NODE_LABEL}) ON (n.{prop})"
+            for prop in INDEXED_PROPERTIES
+        ]
+
+    @staticmethod
+    def _node_color(start: bool, end: bool) -> Optional[str]:
+        """Display color of a node: red for end nodes, green for start nodes."""
+        if end:
+            return END_NODE_COLOR
+        if start:
+            return START_NODE_COLOR
+        return None
+
+    @classmethod
+    def _entity_props(cls, entity: Entity, graph_type: str) -> dict:
+        """Build the node properties stored for a Triplet entity."""
+        return {
+            "id": f"{graph_type}_{entity.id}",
+            "name": f"{graph_type}_{entity.name}",
+            "type": entity.type,
+            "label": entity.label,  # Add entity label as property
+            "graph_type": graph_type,
+            "start": getattr(entity, "start", False),  # Default to False if not set
+            "end": getattr(entity, "end", False),  # Default to False if not set
+            "color": cls._node_color(
+                getattr(entity, "start", False), getattr(entity, "end", False)
+            ),
+        }
+
+    @staticmethod
+    def _relation_props(relation: Relation, graph_type: str) -> dict:
+        """Build the relationship properties stored for a Triplet relation."""
+        return {
+            "type": relation.type,
+            "name": f"{graph_type}_{relation.name}",
+            "label": relation.name,  # Add relation label as property
+            "graph_type": graph_type,
+        }
+
+    @classmethod
+    def _step_props(cls, step: MathStep, graph_type: str) -> dict:
+        """Build the node properties stored for a calculation step."""
+        return {
+            "id": f"{graph_type}_{step.id}",
+            "name": f"{graph_type}_{step.expression}",
+            "type": "step",
+            "label": "Step",  # Add step label as property
+            "graph_type": graph_type,
+            "expression": step.expression,
+            "operation": step.operation,
+            "start": step.is_start,  # Start node flag
+            "end": step.is_end,  # End node flag
+            "color": cls._node_color(step.is_start, step.is_end),
+        }
+
+    @staticmethod
+    def _transition_props(transition: MathTransition, graph_type: str) -> dict:
+        """Build the relationship properties stored for a calculation transition."""
+        return {
+            "type": "transition",
+            "name": f"{graph_type}_{transition.rule}",
+            "label": transition.rule,  # Add transition label as property
+            "graph_type": graph_type,
+            "explanation": transition.explanation,
+        }
+
+    @staticmethod
+    def _relationship_type(name: str, kind: str = "Relationship name") -> str:
+        """
+        Validate a relationship type and enclose it in backticks if necessary.
+        """
+        relationship_name = name.strip()
+        if not relationship_name:
+            raise ValueError(f"{kind} cannot be empty.")
+        if " " in relationship_name or not relationship_name.isalnum():
+            relationship_name = "`" + relationship_name.replace("`", "``") + "`"
+        return relationship_name
+
+    @staticmethod
+    def _create_nodes_query(label: str) -> str:
+        """Query creating one node per row of ``$rows`` with the given label."""
+        return f"UNWIND $rows AS row CREATE (a:`{label}`:{NODE_LABEL}) SET a = row"
+
+    @classmethod
+    def _create_relations_query(cls, name: str, kind: str = "Relationship name") -> str:
+        """
+        Query creating one relationship per row of ``$rows``. Each row holds
+        ``source_id``, ``target_id`` and the relationship ``props``.
+        """
+        relationship_name = cls._relationship_type(name, kind)
+        return (
+            "UNWIND $rows AS row "
+            f"MATCH (a:{NODE_LABEL} {{id: row.source_id}}), "
+            f"(b:{NODE_LABEL} {{id: row.target_id}}) "
+            f"CREATE (a)-[r:{relationship_name}]->(b) SET r = row.props"
+        )
+
+    @classmethod
+    def _batch_statements(
+        cls,
+        query: str,
+        rows: List[dict],
+        batch_size: int,
+    ) -> List[Tuple[str, dict]]:
+        """Split ``rows`` into ``(query, parameters)`` pairs of at most ``batch_size`` rows."""
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+        return [(query, {"rows": chunk}) for chunk in _batched(rows, batch_size)]
+
+    @staticmethod
+    def _content_hash(props: dict) -> str:
+        """Stable hash of a node or relationship property map."""
+        payload = json.dumps(props, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _merge_nodes_query(label: str) -> str:
+        """
+        Query upserting one node per row of ``$rows``, keyed on
+        ``(graph_type, id)``.
+        """
+        return (
+            "UNWIND $rows AS row "
+            f"MERGE (a:{NODE_LABEL} {{graph_type: row.graph_type, id: row.id}}) "
+            f"ON CREATE SET a = row, a:`{label}` "
+            "ON MATCH SET a = row"
+        )
+
+    @classmethod
+    def _merge_relations_query(cls, name: str, kind: str = "Relationship name") -> str:
+        """
+        Query upserting one relationship per row of ``$rows``, keyed on its
+        endpoints and type.
+        """
+        relationship_name = cls._relationship_type(name, kind)
+        return (
+            "UNWIND $rows AS row "
+            f"MATCH (a:{NODE_LABEL} {{graph_type: row.props.graph_type, id: row.source_id}}), "
+            f"(b:{NODE_LABEL} {{graph_type: row.props.graph_type, id: row.target_id}}) "
+            f"MERGE (a)-[r:{relationship_name}]->(b) "
+            "ON CREATE SET r = row.props "
+            "ON MATCH SET r = row.props"
+        )
+
+    @staticmethod
+    def _content_hash_queries() -> Tuple[str, str]:
+        """
+        Queries returning the stored content hashes of the nodes with the given
+        ``$ids`` in ``$graph_type`` and of their outgoing relationships.
+        """
+        node_query = (
+            f"MATCH (n:{NODE_LABEL} {{graph_type: $graph_type}}) WHERE n.id IN $ids "
+            "RETURN n.id AS id, n.content_hash AS content_hash"
+        )
+        relation_query = (
+            f"MATCH (a:{NODE_LABEL} {{graph_type: $graph_type}})-[r]->(b:{NODE_LABEL}) "
+            "WHERE a.id IN $ids "
+            "RETURN a.id AS source_id, b.id AS target_id, type(r) AS name, "
+            "r.content_hash AS content_hash"
+        )
+        return node_query, relation_query
+
+    @classmethod
+    def _triplet_rows(cls, triplet_obj: Triplet, graph_type: str) -> GroupedRows:
+        """
+        Build the node rows of a Triplet grouped by label and its relationship
+        rows grouped by type.
+        """
+        nodes_by_label: Dict[str, List[dict]] = defaultdict(list)
+        for entity in triplet_obj.entities:
+            nodes_by_label[f"{graph_type}_{entity.label}"].append(
+                cls._entity_props(entity, graph_type)
+            )
+
+        relations_by_name: Dict[str, List[dict]] = defaultdict(list)
+        for relation in triplet_obj.relations:
+            relations_by_name[relation.name].append(
+                {
+                    "source_id": f"{graph_type}_{relation.source}",
+                    "target_id": f"{graph_type}_{relation.target}",
+                    "props": cls._relation_props(relation, graph_type),
+                }
+            )
+        return nodes_by_label, relations_by_name
+
+    @classmethod
+    def _hierarchy_rows(
+        cls, hierarchy: TripletHierarchy, graph_type: str
+    ) -> GroupedRows:
+        """
+        Build the rows of every level of a TripletHierarchy, tagged with their
+        graph_level, plus one HIERARCHY_RELATION row from each entity to its
+        parent in the next coarser level.
+        """
+        nodes_by_label: Dict[str, List[dict]] = defaultdict(list)
+        relations_by_name: Dict[str, List[dict]] = defaultdict(list)
+        for level, triplet in hierarchy.levels.items():
+            level_nodes, level_relations = cls._triplet_rows(triplet, graph_type)
+            for label, rows in level_nodes.items():
+                nodes_by_label[label].extend(
+                    {**row, "graph_level": level} for row in rows
+                )
+            for name, rows in level_relations.items():
+                relations_by_name[name].extend(
+                    {**row, "props": {**row["props"], "graph_level": level}}
+                    for row in rows
+                )
+
+        for level, parent_of in hierarchy.parents.items():
+            for child_id, parent_id in parent_of.items():
+                relations_by_name[HIERARCHY_RELATION].append(
+                    {
+                        "source_id": f"{graph_type}_{child_id}",
+                        "target_id": f"{graph_type}_{parent_id}",
+                        "props": {
+                            "type": "hierarchy",
+                            "name": f"{graph_type}_{HIERARCHY_RELATION}",
+                            "label": HIERARCHY_RELATION,
+                            "graph_type": graph_type,
+                            "graph_level": level,
+                        },
+                    }
+                )
+        return nodes_by_label, relations_by_name
+
+    @classmethod
+    def _calculation_graph_rows(
+        cls, calculation_graph: CalculationGraph, graph_type: str
+    ) -> GroupedRows:
+        """
+        Build the step rows of a CalculationGraph and its transition rows
+        grouped by rule.
+        """
+        step_rows = {
+            f"{graph_type}_Step": [
+                cls._step_props(step, graph_type) for step in calculation_graph.steps
+            ]
+        }
+
+        transitions_by_rule: Dict[str, List[dict]] = defaultdict(list)
+        for transition in calculation_graph.transitions:
+            transitions_by_rule[transition.rule].append(
+                {
+                    "source_id": f"{graph_type}_{transition.source}",
+                    "target_id": f"{graph_type}_{transition.target}",
+                    "props": cls._transition_props(transition, graph_type),
+                }
+            )
+        return step_rows, transitions_by_rule
+
+    @classmethod
+    def _create_statements(
+        cls,
+        rows: GroupedRows,
+        batch_size: int,
+        kind: str = "Relationship name",
+    ) -> List[Tuple[str, dict]]:
+        """Build the CREATE statements for grouped node and relationship rows."""
+        nodes_by_label, relations_by_name = rows
+        statements = []
+        for label, node_rows in nodes_by_label.items():
+            query = cls._create_nodes_query(label)
+            statements.extend(cls._batch_statements(query, node_rows, batch_size))
+        for name, relation_rows in relations_by_name.items():
+            query = cls._create_relations_query(name, kind)
+            statements.extend(cls._batch_statements(query, relation_rows, batch_size))
+        return statements
+
+    @classmethod
+    def _upsert_statements(
+        cls,
+        rows: GroupedRows,
+        node_hashes: Dict[str, str],
+        relation_hashes: Dict[Tuple[str, str, str], str],
+        batch_size: int,
+        kind: str = "Relationship name",
+    ) -> List[Tuple[str, dict]]:
+        """
+        Build the MERGE statements for grouped node and relationship rows,
+        leaving out every row whose content hash matches the stored one.
+        """
+        nodes_by_label, relations_by_name = rows
+        statements = []
+        for label, node_rows in nodes_by_label.items():
+            changed = []
+            for row in node_rows:
+                row = {**row, "content_hash": cls._content_hash(row)}
+                if node_hashes.get(row["id"]) != row["content_hash"]:
+                    changed.append(row)
+            query = cls._merge_nodes_query(label)
+            statements.extend(cls._batch_statements(query, changed, batch_size))
+        for name, relation_rows in relations_by_name.items():
+            changed = []
+            for row in relation_rows:
+                props = {**row["props"], "content_hash": cls._content_hash(row["props"])}
+                key = (row["source_id"], row["target_id"], name.strip())
+                if relation_hashes.get(key) != props["content_hash"]:
+                    changed.append({**row, "props": props})
+            query = cls._merge_relations_query(name, kind)
+            statements.extend(cls._batch_statements(query, changed, batch_size))
+        return statements
+
+    @staticmethod
+    def _content_hash_index(
+        node_records: List[dict], relation_records: List[dict]
+    ) -> Tuple[Dict[str, str], Dict[Tuple[str, str, str], str]]:
+        """Index the records returned by the content hash queries by key."""
+        node_hashes = {record["id"]: record["content_hash"] for record in node_records}
+        relation_hashes = {
+            (record["source_id"], record["target_id"], record["name"]): record[
+                "content_hash"
+            ]
+            for record in relation_records
+        }
+        return node_hashes, relation_hashes
+
+    @staticmethod
+    def _node_ids(rows: GroupedRows) -> List[str]:
+        """Ids of every node row in grouped rows."""
+        return [row["id"] for node_rows in rows[0].values() for row in node_rows]
+
+    @classmethod
+    def _triplet_statements(
+        cls,
+        triplet_obj: Triplet,
+        graph_type: str,
+        batch_size: int,
+    ) -> List[Tuple[str, dict]]:
+        """
+        Build the UNWIND statements storing a Triplet, grouping entities by
+        label and relations by type so each query text is reused across rows.
+        """
+        return cls._create_statements(
+            cls._triplet_rows(triplet_obj, graph_type), batch_size
+        )
+
+    @classmethod
+    def _calculation_graph_statements(
+        cls,
+        calculation_graph: CalculationGraph,
+        graph_type: str,
+        batch_size: int,
+    ) -> List[Tuple[str, dict]]:
+        """
+        Build the UNWIND statements storing a CalculationGraph. Transitions are
+        grouped by rule so each distinct query text runs over a parameter list.
+        """
+        return cls._create_statements(
+            cls._calculation_graph_rows(calculation_graph, graph_type),
+            batch_size,
+            "Relationship rule",
+        )
+
+    @staticmethod
+    def _clean_database_statement(
+        step: Optional[int],
+        graph_type: Optional[str] = None,
+        problem: Optional[str] = None,
+        batch_size: Optional[int] = None,
+    ) -> Tuple[str, dict]:
+        """
+        Statement deleting nodes (and their relationships) with a step attribute
+        greater than ``step`` and matching ``graph_type`` / ``problem`` when
+        given. If no filter is provided, delete everything. With ``batch_size``
+        at most that many nodes are deleted. Returns the number of deleted nodes.
+        """
+        conditions = []
+        params: dict = {}
+        if step is not None:
+            conditions.append("n.step > $step")
+            params["step"] = step
+        if graph_type is not None:
+            conditions.append("n.graph_type = $graph_type")
+            params["graph_type"] = graph_type
+        if problem is not None:
+            conditions.append("n.problem = $problem")
+            params["problem"] = problem
+
+        if conditions:
+            query = f"MATCH (n:{NODE_LABEL}) WHERE " + " AND ".join(conditions)
+        else:
+            query = "MATCH (n)"
+        if batch_size is not None:
+            if batch_size < 1:
+                raise ValueError("batch_size must be a positive integer.")
+            query += " WITH n LIMIT $batch_size"
+            params["batch_size"] = batch_size
+        query += " DETACH DELETE n RETURN count(*) AS deleted"
+        return query, params
+
+
+class Neo4JUtils(Neo4JQueryBuilder):
+    def __init__(
+        self,
+        uri: str,
+        auth: tuple[str, str],
+        ensure_indexes: bool = True,
+        **driver_config,
+    ) -> None:
+        # Drivers are shared per URI/auth across instances; driver_config
+        # (pool size, acquisition and liveness timeouts) is passed to get_driver
+        self.driver = get_driver(uri, auth, **driver_config)
         self.step: int = 0  # Initialize step counter
+        if ensure_indexes:
+            # Once per shared driver, not once per instance
+            provision_once(self.driver, "graph_node_indexes", self.ensure_indexes)
 
     def close(self) -> None:
-        """Close the Neo4J driver connection."""
-        self.driver.close()
+        """
+        Release this instance. The driver is shared with other instances using
+        the same URI/auth and stays open until close_all_drivers() runs, which
+        happens at interpreter exit at the latest.
+        """
+        self.driver = None
+
+    def ensure_indexes(self) -> None:
+        """
+        Create the range indexes used by id, graph_type, graph_level, step and
+        problem lookups if they do not exist yet.
+        """
+        with self.driver.session() as session:
+            for query in self._index_queries():
+                session.run(query)
 
     def create_node_with_props(
         self, entity: Entity, properties: Optional[dict] = None
@@ -63,13 +532,41 @@ class Neo4JUtils:
         with self.driver.session() as session:
             session.execute_write(self._create_relation, relation, step)
 
-    def clean_database(self, step: Optional[int] = None) -> None:
+    def clean_database(
+        self,
+        step: Optional[int] = None,
+        graph_type: Optional[str] = None,
+        problem: Optional[str] = None,
+        batch_size: Optional[int] = DEFAULT_DELETE_BATCH_SIZE,
+        verbose: bool = False,
+    ) -> int:
         """
         Clean the database by deleting nodes and relationships with a step attribute
         greater than the input parameter. If no step is provided, delete all nodes and relationships.
+
+        Args:
+            step: Only delete nodes whose step is greater than this value
+            graph_type: Only delete nodes of this graph type
+            problem: Only delete nodes of this problem
+            batch_size: Maximum number of nodes deleted per transaction, so large
+                graphs do not exhaust the server heap; None deletes in one transaction
+            verbose: Whether to print progress after each batch
+
+        Returns:
+            Number of deleted nodes
         """
+        query, params = self._clean_database_statement(
+            step, graph_type, problem, batch_size
+        )
+        total_deleted = 0
         with self.driver.session() as session:
-            session.execute_write(self._clean_database, step)
+            while True:
+                deleted = session.execute_write(self._delete_nodes, query, params)
+                total_deleted += deleted
+                if verbose:
+                    print(f"Deleted {total_deleted} nodes")
+                if batch_size is None or deleted < batch_size:
+                    return total_deleted
 
     def increment_step(self) -> None:
         """Increment the step counter."""
@@ -79,19 +576,38 @@ class Neo4JUtils:
         self,
         triplet_obj: Triplet,
         graph_type: Literal["course_pattern", "proof_example"],
+        bulk: bool = False,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        upsert: bool = False,
     ) -> None:
+        """
+        Store a Triplet object in Neo4j.
+
+        Args:
+            triplet_obj: Triplet object containing entities and relations
+            graph_type: Type of graph (course_pattern or proof_example)
+            bulk: Write entities grouped by label and relations grouped by type
+                with one UNWIND statement per batch, all in a single transaction
+            batch_size: Maximum number of rows per UNWIND statement in bulk mode
+            upsert: MERGE nodes on (graph_type, id) and relations on their
+                endpoints instead of creating them, skipping every node and
+                relation whose content hash is unchanged. Implies bulk mode.
+        """
+        if upsert:
+            rows = self._triplet_rows(triplet_obj, graph_type)
+            with self.driver.session() as session:
+                session.execute_write(self._upsert_rows, rows, graph_type, batch_size)
+            return
+
+        if bulk:
+            statements = self._triplet_statements(triplet_obj, graph_type, batch_size)
+            with self.driver.session() as session:
+                session.execute_write(self._run_statements, statements)
+            return
+
         # First pass: create all nodes with their properties
         for entity in triplet_obj.entities:
-            # Create a properties dictionary that includes all entity properties
-            props = {
-                "id": f"{graph_type}_{entity.id}",
-                "name": f"{graph_type}_{entity.name}",
-                "type": entity.type,
-                "label": entity.label,  # Add entity label as property
-                "graph_type": graph_type,
-                "start": getattr(entity, "start", False),  # Default to False if not set
-                "end": getattr(entity, "end", False),  # Default to False if not set
-            }
+            props = self._entity_props(entity, graph_type)
             # Prefix the label with graph type
             entity_label = f"{graph_type}_{entity.label}"
             with self.driver.session() as session:
@@ -99,12 +615,7 @@ class Neo4JUtils:
 
         # Second pass: create all relationships
         for relation in triplet_obj.relations:
-            props = {
-                "type": relation.type,
-                "name": f"{graph_type}_{relation.name}",
-                "label": relation.name,  # Add relation label as property
-                "graph_type": graph_type,
-            }
+            props = self._relation_props(relation, graph_type)
             # Update source and target IDs to match the prefixed node IDs
             source_id = f"{graph_type}_{relation.source}"
             target_id = f"{graph_type}_{relation.target}"
@@ -117,14 +628,81 @@ class Neo4JUtils:
                     target_id,
                 )
 
-        # Third pass: set colors for start and end nodes
+    def store_triplet_stream(
+        self,
+        items: Iterable[Union[Entity, Relation]],
+        graph_type: Literal["course_pattern", "proof_example"],
+        flush_size: int = 10,
+    ) -> None:
+        """
+        Store entities and relations while they are being extracted, e.g. from
+        stream_triplets, so the first nodes show up before the LLM finishes.
+
+        Args:
+            items: Entity and Relation objects, entities before the relations
+                that refer to them
+            graph_type: Type of graph (course_pattern or proof_example)
+            flush_size: Number of pending items written per transaction
+        """
+        entities: List[Entity] = []
+        relations: List[Relation] = []
+
+        def flush() -> None:
+            if not entities and not relations:
+                return
+            statements = self._triplet_statements(
+                Triplet(entities=list(entities), relations=list(relations)),
+                graph_type,
+                DEFAULT_BATCH_SIZE,
+            )
+            with self.driver.session() as session:
+                session.execute_write(self._run_statements, statements)
+            entities.clear()
+            relations.clear()
+
+        for item in items:
+            if isinstance(item, Entity):
+                entities.append(item)
+            else:
+                relations.append(item)
+            if len(entities) + len(relations) >= flush_size:
+                flush()
+        flush()
+
+    def store_triplet_hierarchy(
+        self,
+        hierarchy: TripletHierarchy,
+        graph_type: Literal["course_pattern", "proof_example"],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        upsert: bool = False,
+    ) -> None:
+        """
+        Store every level of a TripletHierarchy in one transaction. Nodes and
+        relations carry a graph_level property and each entity is linked to
+        its parent in the next coarser level by a PART_OF relation.
+
+        Args:
+            hierarchy: TripletHierarchy from extract_hierarchical_triplets
+            graph_type: Type of graph (course_pattern or proof_example)
+            batch_size: Maximum number of rows per UNWIND statement
+            upsert: MERGE instead of CREATE, skipping unchanged nodes and relations
+        """
+        rows = self._hierarchy_rows(hierarchy, graph_type)
         with self.driver.session() as session:
-            session.execute_write(self._set_node_colors)
+            if upsert:
+                session.execute_write(self._upsert_rows, rows, graph_type, batch_size)
+            else:
+                session.execute_write(
+                    self._run_statements, self._create_statements(rows, batch_size)
+                )
 
     def store_calculation_graph(
         self,
         calculation_graph: CalculationGraph,
         graph_type: Literal["course_pattern", "proof_example"],
+        bulk: bool = False,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        upsert: bool = False,
     ) -> None:
         """
         Store a CalculationGraph object in Neo4j for visualization.
@@ -132,21 +710,32 @@ class Neo4JUtils:
         Args:
             calculation_graph: CalculationGraph object containing steps and transitions
             graph_type: Type of graph (course_pattern or proof_example)
+            bulk: Write all steps and transitions in a single transaction, with
+                transitions grouped by rule so each query text runs once per batch
+            batch_size: Maximum number of rows per UNWIND statement in bulk mode
+            upsert: MERGE steps on (graph_type, id) and transitions on their
+                endpoints instead of creating them, skipping every step and
+                transition whose content hash is unchanged. Implies bulk mode.
         """
+        if upsert:
+            rows = self._calculation_graph_rows(calculation_graph, graph_type)
+            with self.driver.session() as session:
+                session.execute_write(
+                    self._upsert_rows, rows, graph_type, batch_size, "Relationship rule"
+                )
+            return
+
+        if bulk:
+            statements = self._calculation_graph_statements(
+                calculation_graph, graph_type, batch_size
+            )
+            with self.driver.session() as session:
+                session.execute_write(self._run_statements, statements)
+            return
+
         # First pass: create all step nodes with their properties
         for step in calculation_graph.steps:
-            # Create a properties dictionary that includes all step properties
-            props = {
-                "id": f"{graph_type}_{step.id}",
-                "name": f"{graph_type}_{step.expression}",
-                "type": "step",
-                "label": "Step",  # Add step label as property
-                "graph_type": graph_type,
-                "expression": step.expression,
-                "operation": step.operation,
-                "start": step.is_start,  # Start node flag
-                "end": step.is_end,  # End node flag
-            }
+            props = self._step_props(step, graph_type)
             # Prefix the label with graph type
             step_label = f"{graph_type}_Step"
             with self.driver.session() as session:
@@ -154,13 +743,7 @@ class Neo4JUtils:
 
         # Second pass: create all transitions
         for transition in calculation_graph.transitions:
-            props = {
-                "type": "transition",
-                "name": f"{graph_type}_{transition.rule}",
-                "label": transition.rule,  # Add transition label as property
-                "graph_type": graph_type,
-                "explanation": transition.explanation,
-            }
+            props = self._transition_props(transition, graph_type)
             # Update source and target IDs to match the prefixed node IDs
             source_id = f"{graph_type}_{transition.source}"
             target_id = f"{graph_type}_{transition.target}"
@@ -173,9 +756,35 @@ class Neo4JUtils:
                     target_id,
                 )
 
-        # Third pass: set colors for start and end nodes
-        with self.driver.session() as session:
-            session.execute_write(self._set_node_colors)
+    @staticmethod
+    def _run_statements(tx, statements: List[Tuple[str, dict]]) -> None:
+        """Internal method to run prepared statements in one transaction."""
+        for query, params in statements:
+            tx.run(query, params)
+
+    @classmethod
+    def _upsert_rows(
+        cls,
+        tx,
+        rows: GroupedRows,
+        graph_type: str,
+        batch_size: int,
+        kind: str = "Relationship name",
+    ) -> None:
+        """
+        Internal method to MERGE the grouped rows whose content hash differs
+        from the one stored in the database.
+        """
+        node_query, relation_query = cls._content_hash_queries()
+        params = {"graph_type": graph_type, "ids": cls._node_ids(rows)}
+        node_hashes, relation_hashes = cls._content_hash_index(
+            tx.run(node_query, params).data(), tx.run(relation_query, params).data()
+        )
+        statements = cls._upsert_statements(
+            rows, node_hashes, relation_hashes, batch_size, kind
+        )
+        if statements:
+            cls._run_statements(tx, statements)
 
     @staticmethod
     def _create_node(tx, entity: Entity, step: int) -> None:
@@ -185,7 +794,7 @@ class Neo4JUtils:
         query = (
             "CREATE (a:`"
             + entity.label
-            + "` {id: $id, name: $name, type: $type, step: $step})"
+            + f"`:{NODE_LABEL} {{id: $id, name: $name, type: $type, step: $step}})"
         )
         tx.run(query, id=entity.id, name=entity.name, type=entity.type, step=step)
 
@@ -195,44 +804,35 @@ class Neo4JUtils:
         Internal method to create a node with arbitrary properties.
         """
         prop_keys = ", ".join([f"{k}: ${k}" for k in props.keys()])
-        query = f"CREATE (a:`{label}` {{{prop_keys}}})"
+        query = f"CREATE (a:`{label}`:{NODE_LABEL} {{{prop_keys}}})"
         tx.run(query, **props)
 
-    @staticmethod
+    @classmethod
     def _create_relation_with_props(
-        tx, relation: Relation, props: dict, source_id: str, target_id: str
+        cls, tx, relation: Relation, props: dict, source_id: str, target_id: str
     ) -> None:
         """
         Internal method to create a relationship with arbitrary properties.
         """
-        # Ensure the relationship type is valid and enclosed in backticks if necessary
-        relationship_name = relation.name.strip()
-        if not relationship_name:
-            raise ValueError("Relationship name cannot be empty.")
-        if " " in relationship_name or not relationship_name.isalnum():
-            relationship_name = f"`{relationship_name}`"
+        relationship_name = cls._relationship_type(relation.name)
 
         prop_keys = ", ".join([f"{k}: ${k}" for k in props.keys()])
         query = (
-            "MATCH (a {id: $source_id}), (b {id: $target_id}) "
+            f"MATCH (a:{NODE_LABEL} {{id: $source_id}}), "
+            f"(b:{NODE_LABEL} {{id: $target_id}}) "
             f"CREATE (a)-[r:{relationship_name} {{{prop_keys}}}]->(b)"
         )
         tx.run(query, source_id=source_id, target_id=target_id, **props)
 
-    @staticmethod
-    def _create_relation(tx, relation: Relation, step: int) -> None:
+    @classmethod
+    def _create_relation(cls, tx, relation: Relation, step: int) -> None:
         """
         Internal method to create a relationship with a step attribute.
         """
-        # Ensure the relationship type is valid and enclosed in backticks if necessary
-        relationship_name = relation.name.strip()  # Remove leading/trailing spaces
-        if not relationship_name:
-            raise ValueError("Relationship name cannot be empty.")
-        if " " in relationship_name or not relationship_name.isalnum():
-            relationship_name = f"`{relationship_name}`"  # Enclose in backticks
+        relationship_name = cls._relationship_type(relation.name)
 
         query = (
-            "MATCH (a {id: $source}), (b {id: $target}) "
+            f"MATCH (a:{NODE_LABEL} {{id: $source}}), (b:{NODE_LABEL} {{id: $target}}) "
             f"CREATE (a)-[r:{relationship_name} {{type: $type, step: $step}}]->(b)"
         )
         tx.run(
@@ -244,52 +844,26 @@ class Neo4JUtils:
         )
 
     @staticmethod
-    def _clean_database(tx, step: Optional[int]) -> None:
-        """
-        Internal method to delete nodes and relationships with a step attribute
-        smaller than the input parameter. If no step is provided, delete all nodes and relationships.
-        """
-        if step is not None:
-            # Delete nodes and relationships with step < input step
-            tx.run("MATCH (n) WHERE n.step > $step DETACH DELETE n", step=step)
-        else:
-            # Delete all nodes and relationships
-            tx.run("MATCH (n) DETACH DELETE n")
-
-    @staticmethod
-    def _set_node_colors(tx) -> None:
-        """Set colors for start and end nodes."""
-        # Set green color for start nodes
-        query = """
-        MATCH (n {start: true})
-        SET n.color = '#00ff00'
+    def _delete_nodes(tx, query: str, params: dict) -> int:
         """
-        tx.run(query)
-
-        # Set red color for end nodes
-        query = """
-        MATCH (n {end: true})
-        SET n.color = '#ff0000'
+        Internal method to run a delete statement and return the number of
+        deleted nodes.
         """
-        tx.run(query)
+        return tx.run(query, params).single()["deleted"]
 
-    @staticmethod
+    @classmethod
     def _create_math_transition(
-        tx, transition, props: dict, source_id: str, target_id: str
+        cls, tx, transition, props: dict, source_id: str, target_id: str
     ) -> None:
         """
         Internal method to create a relationship from a MathTransition object.
         """
-        # Ensure the relationship type is valid and enclosed in backticks if necessary
-        relationship_name = transition.rule.strip()
-        if not relationship_name:
-            raise ValueError("Relationship rule cannot be empty.")
-        if " " in relationship_name or not relationship_name.isalnum():
-            relationship_name = f"`{relationship_name}`"
+        relationship_name = cls._relationship_type(transition.rule, "Relationship rule")
 
         prop_keys = ", ".join([f"{k}: ${k}" for k in props.keys()])
         query = (
-            "MATCH (a {id: $source_id}), (b {id: $target_id}) "
+            f"MATCH (a:{NODE_LABEL} {{id: $source_id}}), "
+            f"(b:{NODE_LABEL} {{id: $target_id}}) "
             f"CREATE (a)-[r:{relationship_name} {{{prop_keys}}}]->(b)"
         )
         tx.run(query, source_id=source_id, target_id=target_id, **props)
@@ -325,3 +899,218 @@ WITH patterns, collect(proof) as proofs
 RETURN patterns, proofs
 ```
 """
+
+
+class AsyncNeo4JUtils(Neo4JQueryBuilder):
+    """
+    Asynchronous counterpart of Neo4JUtils built on neo4j.AsyncGraphDatabase,
+    so graph writes can overlap with other coroutines (e.g. LLM extraction
+    calls) in the same event loop. Writes always use the batched UNWIND
+    statements of the bulk mode, one transaction per call.
+    """
+
+    def __init__(
+        self, uri: str, auth: tuple[str, str], ensure_indexes: bool = True
+    ) -> None:
+        self.driver = AsyncGraphDatabase.driver(uri, auth=auth)
+        # Indexes are created lazily before the first write, since the
+        # constructor cannot await
+        self._indexes_ready = not ensure_indexes
+
+    async def close(self) -> None:
+        """Close the Neo4J driver connection."""
+        await self.driver.close()
+
+    async def __aenter__(self) -> "AsyncNeo4JUtils":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def ensure_indexes(self) -> None:
+        """
+        Create the range indexes used by id, graph_type, graph_level, step and
+        problem lookups if they do not exist yet.
+        """
+        async with self.driver.session() as session:
+            for query in self._index_queries():
+                result = await session.run(query)
+                await result.consume()
+        self._indexes_ready = True
+
+    async def clean_database(
+        self,
+        step: Optional[int] = None,
+        graph_type: Optional[str] = None,
+        problem: Optional[str] = None,
+        batch_size: Optional[int] = DEFAULT_DELETE_BATCH_SIZE,
+        verbose: bool = False,
+    ) -> int:
+        """
+        Clean the database by deleting nodes and relationships with a step attribute
+        greater than the input parameter. If no step is provided, delete all nodes and relationships.
+
+        Args:
+            step: Only delete nodes whose step is greater than this value
+            graph_type: Only delete nodes of this graph type
+            problem: Only delete nodes of this problem
+            batch_size: Maximum number of nodes deleted per transaction; None
+                deletes in one transaction
+            verbose: Whether to print progress after each batch
+
+        Returns:
+            Number of deleted nodes
+        """
+        if not self._indexes_ready:
+            await self.ensure_indexes()
+        query, params = self._clean_database_statement(
+            step, graph_type, problem, batch_size
+        )
+        total_deleted = 0
+        async with self.driver.session() as session:
+            while True:
+                deleted = await session.execute_write(
+                    self._delete_nodes, query, params
+                )
+                total_deleted += deleted
+                if verbose:
+                    print(f"Deleted {total_deleted} nodes")
+                if batch_size is None or deleted < batch_size:
+                    return total_deleted
+
+    async def store_triplets(
+        self,
+        triplet_obj: Triplet,
+        graph_type: Literal["course_pattern", "proof_example"],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        upsert: bool = False,
+    ) -> None:
+        """
+        Store a Triplet object in Neo4j in a single transaction.
+
+        Args:
+            triplet_obj: Triplet object containing entities and relations
+            graph_type: Type of graph (course_pattern or proof_example)
+            batch_size: Maximum number of rows per UNWIND statement
+            upsert: MERGE instead of CREATE, skipping unchanged nodes and relations
+        """
+        if upsert:
+            await self._write_upsert(
+                self._triplet_rows(triplet_obj, graph_type), graph_type, batch_size
+            )
+            return
+        await self._write(
+            self._triplet_statements(triplet_obj, graph_type, batch_size)
+        )
+
+    async def store_triplet_hierarchy(
+        self,
+        hierarchy: TripletHierarchy,
+        graph_type: Literal["course_pattern", "proof_example"],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        upsert: bool = False,
+    ) -> None:
+        """
+        Store every level of a TripletHierarchy in a single transaction, see
+        Neo4JUtils.store_triplet_hierarchy.
+        """
+        rows = self._hierarchy_rows(hierarchy, graph_type)
+        if upsert:
+            await self._write_upsert(rows, graph_type, batch_size)
+            return
+        await self._write(self._create_statements(rows, batch_size))
+
+    async def store_calculation_graph(
+        self,
+        calculation_graph: CalculationGraph,
+        graph_type: Literal["course_pattern", "proof_example"],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        upsert: bool = False,
+    ) -> None:
+        """
+        Store a CalculationGraph object in Neo4j in a single transaction.
+
+        Args:
+            calculation_graph: CalculationGraph object containing steps and transitions
+            graph_type: Type of graph (course_pattern or proof_example)
+            batch_size: Maximum number of rows per UNWIND statement
+            upsert: MERGE instead of CREATE, skipping unchanged steps and transitions
+        """
+        if upsert:
+            await self._write_upsert(
+                self._calculation_graph_rows(calculation_graph, graph_type),
+                graph_type,
+                batch_size,
+                "Relationship rule",
+            )
+            return
+        await self._write(
+            self._calculation_graph_statements(
+                calculation_graph, graph_type, batch_size
+            )
+        )
+
+    async def _write(self, statements: List[Tuple[str, dict]]) -> None:
+        """Run prepared statements in one write transaction."""
+        if not self._indexes_ready:
+            await self.ensure_indexes()
+        async with self.driver.session() as session:
+            await session.execute_write(self._run_statements, statements)
+
+    async def _write_upsert(
+        self,
+        rows: GroupedRows,
+        graph_type: str,
+        batch_size: int,
+        kind: str = "Relationship name",
+    ) -> None:
+        """MERGE grouped rows in one write transaction."""
+        if not self._indexes_ready:
+            await self.ensure_indexes()
+        async with self.driver.session() as session:
+            await session.execute_write(
+                self._upsert_rows, rows, graph_type, batch_size, kind
+            )
+
+    @staticmethod
+    async def _run_statements(tx, statements: List[Tuple[str, dict]]) -> None:
+        """Internal method to run prepared statements inside a transaction."""
+        for query, params in statements:
+            result = await tx.run(query, params)
+            await result.consume()
+
+    @classmethod
+    async def _upsert_rows(
+        cls,
+        tx,
+        rows: GroupedRows,
+        graph_type: str,
+        batch_size: int,
+        kind: str = "Relationship name",
+    ) -> None:
+        """
+        Internal method to MERGE the grouped rows whose content hash differs
+        from the one stored in the database.
+        """
+        node_query, relation_query = cls._content_hash_queries()
+        params = {"graph_type": graph_type, "ids": cls._node_ids(rows)}
+        node_records = await (await tx.run(node_query, params)).data()
+        relation_records = await (await tx.run(relation_query, params)).data()
+        node_hashes, relation_hashes = cls._content_hash_index(
+            node_records, relation_records
+        )
+        statements = cls._upsert_statements(
+            rows, node_hashes, relation_hashes, batch_size, kind
+        )
+        if statements:
+            await cls._run_statements(tx, statements)
+
+    @staticmethod
+    async def _delete_nodes(tx, query: str, params: dict) -> int:
+        """
+        Internal method to run a delete statement and return the number of
+        deleted nodes.
+        """
+        result = await tx.run(query, params)
+        record = await result.single()
+        return record["deleted"]